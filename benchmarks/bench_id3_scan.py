@@ -0,0 +1,61 @@
+# Compares the library scan throughput (files/sec) of the header-only ID3
+# reader of localsongs with the eyed3 based one used before.
+#
+# Usage:
+#   python benchmarks/bench_id3_scan.py DIRECTORY
+#
+# All the mp3 files under DIRECTORY are read, images excluded (as the
+# library scan does); the best of a few iterations is reported.
+
+import os
+import sys
+import time
+
+from music_dragon import localsongs
+
+ITERATIONS = 3
+
+
+def mp3_files(directory):
+    files = []
+    for root, dirs, files_ in os.walk(directory):
+        files += [os.path.join(root, f) for f in files_ if f.endswith(".mp3")]
+    return files
+
+
+def bench(name, files, load):
+    best = None
+    loaded = 0
+    for _ in range(ITERATIONS):
+        loaded = 0
+        start = time.perf_counter()
+        for f in files:
+            mp3 = localsongs.Mp3()
+            mp3.path = os.path.abspath(f)
+            if load(mp3, f):
+                loaded += 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{name:>8}: {loaded}/{len(files)} loaded, {len(files) / best:8.1f} files/sec")
+    return best
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} DIRECTORY")
+        return
+    files = mp3_files(sys.argv[1])
+    if not files:
+        print("No mp3 files")
+        return
+    print(f"{len(files)} files")
+
+    fast_time = bench("id3", files, lambda mp3, f: mp3.load_from_file(f, load_image=False))
+    eyed3_time = bench("eyed3", files, lambda mp3, f: mp3._load_from_file_with_eyed3(f, load_image=False))
+
+    print(f"speedup: {eyed3_time / fast_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
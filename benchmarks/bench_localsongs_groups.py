@@ -0,0 +1,65 @@
+# Measures the time taken to collect what a local artist page shows
+# (the albums of the artist, with a group leader each, and the tracks
+# of an album) with the artist -> album -> mp3s groups of localsongs,
+# compared with the pass over the whole library done before.
+#
+# Usage:
+#   python benchmarks/bench_localsongs_groups.py [N_SONGS]
+#
+# The library is made of N_SONGS (default 100000) synthetic songs
+# (see bench_localsongs_memory.py).
+
+import random
+import sys
+import time
+
+from bench_localsongs_memory import synthetic_infos, SONGS_PER_ALBUM, ALBUMS_PER_ARTIST
+from music_dragon import localsongs
+
+ITERATIONS = 50
+
+
+def artist_page_linear(artist):
+    albums = {}
+    for mp3 in localsongs.mp3s:
+        if mp3.artist == artist and mp3.album not in albums:
+            albums[mp3.album] = mp3
+    album = next(iter(albums))
+    tracks = [mp3 for mp3 in localsongs.mp3s if mp3.artist == artist and mp3.album == album]
+    return albums, tracks
+
+
+def artist_page_groups(artist):
+    albums = {}
+    for album in localsongs.albums_of_artist(artist):
+        albums[album] = localsongs.tracks_of_album(artist, album)[0]
+    album = next(iter(albums))
+    tracks = localsongs.tracks_of_album(artist, album)
+    return albums, tracks
+
+
+def bench(name, artists, artist_page):
+    start = time.perf_counter()
+    for artist in artists:
+        albums, tracks = artist_page(artist)
+        assert len(albums) == ALBUMS_PER_ARTIST and len(tracks) == SONGS_PER_ALBUM
+    elapsed = (time.perf_counter() - start) / len(artists)
+    print(f"{name:>8}: {1000 * elapsed:8.3f} ms per artist page")
+    return elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for info in synthetic_infos(n):
+        localsongs.load_mp3_from_info(info, load_image=False)
+    print(f"{len(localsongs.mp3s)} songs")
+
+    random.seed(0)
+    artists = random.choices(localsongs.artists()[:-1], k=ITERATIONS) # (the last one may be incomplete)
+    linear = bench("linear", artists, artist_page_linear)
+    groups = bench("groups", artists, artist_page_groups)
+    print(f"speedup: {linear / groups:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# Measures the memory taken by the local songs library (localsongs.mp3s
+# and its metadata index) with the column store of localsongs, compared
+# with the one object (with __dict__) per mp3 used before.
+#
+# Usage:
+#   python benchmarks/bench_localsongs_memory.py [N_SONGS]
+#
+# The library is made of N_SONGS (default 200000) synthetic songs, loaded
+# as they are from the local songs cache.
+
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+from music_dragon import localsongs
+
+SONGS_PER_ALBUM = 12
+ALBUMS_PER_ARTIST = 8
+
+
+class LegacyMp3:
+    # As the attributes were stored before
+    def __init__(self):
+        self.tag = None
+        self.length = None
+        self.artist = None
+        self.album = None
+        self.song = None
+        self.track_num = None
+        self.image_fingerprint = None
+        self.image_offset = None
+        self.image_length = None
+        self.size = None
+        self.mtime_ns = None
+        self.inode = None
+        self.year = None
+        self.path = None
+        self.fetched_release_group = False
+        self.release_group_id = None
+        self.fetched_artist = False
+        self.artist_id = None
+        self.fetched_track = False
+        self.track_id = None
+
+    def load_from_info(self, info: dict):
+        self.size = info.get("size")
+        self.mtime_ns = info.get("mtime_ns")
+        self.inode = info.get("inode")
+        self.path = Path(info.get("path"))
+        self.length = info.get("length")
+        self.artist = info.get("artist")
+        self.album = info.get("album")
+        self.song = info.get("song")
+        self.track_num = info.get("track_num")
+        self.year = info.get("year")
+        self.image_offset = info.get("image_offset")
+        self.image_length = info.get("image_length")
+        self.image_fingerprint = info.get("image_fingerprint")
+
+
+def synthetic_infos(n):
+    # (strings built for each song, as they come from json)
+    random.seed(0)
+    for i in range(n):
+        album = i // SONGS_PER_ALBUM
+        artist = album // ALBUMS_PER_ARTIST
+        track_num = i % SONGS_PER_ALBUM + 1
+        song = f"Song {i} with a title of usual length"
+        yield {
+            "path": f"/home/user/Music/Artist {artist}/Album {album}/{track_num:02} - {song}.mp3",
+            "length": float(random.randint(120000, 400000)),
+            "artist": "".join(["Artist ", str(artist)]),
+            "album": "".join(["Album ", str(album)]),
+            "song": song,
+            "track_num": track_num,
+            "year": 1970 + album % 50,
+            "size": random.randint(2 ** 21, 2 ** 24),
+            "mtime_ns": random.randint(2 ** 60, 2 ** 61),
+            "inode": random.randint(2 ** 20, 2 ** 30),
+            "image_offset": 20 + random.randint(0, 100),
+            "image_length": random.randint(2 ** 15, 2 ** 18),
+            "image_fingerprint": f"{album * 7919 % 2 ** 32}-{album}", # (one cover per album)
+        }
+
+
+def bench(name, n, mp3_class):
+    tracemalloc.start()
+    library = []
+    indexes_by_metadata = {}
+    for info in synthetic_infos(n):
+        mp3 = mp3_class()
+        mp3.load_from_info(info)
+        indexes_by_metadata[(mp3.artist, mp3.album, mp3.song)] = len(library)
+        library.append(mp3)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>8}: {size / 2 ** 20:8.1f} MB, {size / n:6.0f} bytes per song")
+    return size
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f"{n} songs")
+    legacy = bench("objects", n, LegacyMp3)
+    columns = bench("columns", n, lambda: localsongs.Mp3())
+    print(f"memory: {columns / legacy:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# Measures the time taken to filter the local songs with the search index
+# of localsongs, compared with matching the filter against the song,
+# artist and album of every song, as done before.
+#
+# Usage:
+#   python benchmarks/bench_localsongs_search.py [N_SONGS]
+#
+# The library is made of N_SONGS (default 100000) synthetic songs
+# (see bench_localsongs_memory.py).
+
+import re
+import sys
+import time
+
+from bench_localsongs_memory import synthetic_infos
+from music_dragon import localsongs
+
+FILTERS = ["s", "so", "son", "song 123", "artist 42", "album 77 song", "usual", "lenght", "xyz"]
+
+
+def filter_linear(text):
+    reg_exp = re.compile(re.escape(text), re.IGNORECASE)
+    return {mp3 for mp3 in localsongs.mp3s
+            if reg_exp.search(mp3.title()) or reg_exp.search(mp3.artist or "") or reg_exp.search(mp3.album or "")}
+
+
+def filter_index(text):
+    # (what LocalSongsProxyModel does: search once, then a lookup per row)
+    matches = localsongs.search(text)
+    return {mp3 for mp3 in localsongs.mp3s if matches is None or mp3 in matches}
+
+
+def bench(name, text, filter_songs):
+    start = time.perf_counter()
+    matches = filter_songs(text)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8} {text!r:>16}: {1000 * elapsed:8.1f} ms, {len(matches):6} songs")
+    return elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for info in synthetic_infos(n):
+        localsongs.load_mp3_from_info(info, load_image=False)
+    print(f"{len(localsongs.mp3s)} songs")
+
+    start = time.perf_counter()
+    localsongs.search("index")
+    print(f"index built in {1000 * (time.perf_counter() - start):.0f} ms")
+
+    for text in FILTERS:
+        bench("linear", text, filter_linear)
+        bench("index", text, filter_index)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Compares the current request cache encoding (compressed marshal) with the
+# plain json.dump files used before, in terms of cold read latency
+# (read from disk + decode) and disk footprint.
+#
+# Usage:
+#   python benchmarks/bench_request_cache.py [CACHE_DIR]
+#
+# If CACHE_DIR (a packed cache folder) is given, the cached requests are used
+# as samples; otherwise synthetic MusicBrainz-like release group releases are.
+
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from music_dragon import cache
+
+ITERATIONS = 5
+
+
+def synthetic_release_group_releases(n_releases=40, n_tracks=16):
+    def uuid():
+        return "-".join("".join(random.choices("0123456789abcdef", k=k)) for k in (8, 4, 4, 4, 12))
+
+    rg_id = uuid()
+    releases = []
+    for _ in range(n_releases):
+        tracks = []
+        for pos in range(1, n_tracks + 1):
+            length = str(random.randint(120000, 400000))
+            tracks.append({
+                "id": uuid(),
+                "position": str(pos),
+                "number": str(pos),
+                "length": length,
+                "recording": {
+                    "id": uuid(),
+                    "title": f"Song number {pos} of the album",
+                    "length": length,
+                },
+                "track_or_recording_length": length,
+            })
+        releases.append({
+            "id": uuid(),
+            "title": "Some Album Title",
+            "status": "Official",
+            "country": random.choice(["US", "GB", "DE", "JP", "XE"]),
+            "date": f"{random.randint(1970, 2020)}-01-01",
+            "release-group": {"id": rg_id, "primary-type": "Album"},
+            "medium-list": [{
+                "position": "1",
+                "format": random.choice(["CD", "Digital Media", "12\" Vinyl"]),
+                "track-list": tracks,
+                "track-count": n_tracks,
+            }],
+            "medium-count": 1,
+        })
+    return releases
+
+
+def load_samples():
+    if len(sys.argv) > 1:
+        backend = cache.PackedCacheBackend(Path(sys.argv[1]))
+        backend.load()
+        samples = []
+        for key, entry in list(backend.index.items()):
+            if entry[cache.PackedCacheBackend.NAMESPACE] != cache.NAMESPACE_REQUEST:
+                continue
+            try:
+                samples.append(cache._decode_request(backend.get(key))[0])
+            except Exception:
+                pass
+        backend.close()
+        return samples
+    random.seed(0)
+    return [synthetic_release_group_releases() for _ in range(200)]
+
+
+def bench(name, directory: Path, samples, encode, decode):
+    paths = []
+    for i, sample in enumerate(samples):
+        p = directory / f"{name}-{i}"
+        p.write_bytes(encode(sample))
+        paths.append(p)
+
+    footprint = sum(p.stat().st_size for p in paths)
+
+    best = None
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        for p in paths:
+            decode(p.read_bytes())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{name:>10}: {footprint / 2 ** 20:8.2f} MB on disk, "
+          f"{1000 * best / len(paths):7.3f} ms per read")
+    return footprint, best
+
+
+def main():
+    samples = load_samples()
+    if not samples:
+        print("No samples")
+        return
+    print(f"{len(samples)} samples")
+
+    with tempfile.TemporaryDirectory() as d:
+        d = Path(d)
+        json_size, json_time = bench("json", d, samples,
+                                     lambda v: json.dumps(v).encode(),
+                                     lambda data: json.loads(data))
+        packed_size, packed_time = bench("marshal+z", d, samples,
+                                         lambda v: cache._encode_request(v)[0],
+                                         lambda data: cache._decode_request(data)[0])
+
+    print(f"footprint: {packed_size / json_size:.2f}x, read time: {packed_time / json_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
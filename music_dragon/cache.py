@@ -1,11 +1,27 @@
+import json
+import marshal
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
 from pathlib import Path
-from typing import Optional, Union
+from typing import Optional, Union, Dict, List, Any, Callable, Tuple, Iterator
 
-import json
+from music_dragon import workers
 from music_dragon.log import debug
 from music_dragon.utils import app_cache_path, get_folder_size
+from music_dragon.workers import Worker
 
 _cache_path: Optional[Path] = None
+_backend: Optional['CacheBackend'] = None
+_memory: Optional['MemoryCache'] = None
+_writer: Optional['CacheWriter'] = None
+_localsongs_snapshot: Optional['LocalSongsSnapshot'] = None
 
 _images_caching = False
 _requests_caching = False
@@ -13,11 +29,1041 @@ _localsongs_caching = False
 
 _LOCALSONGS_CACHE_FILENAME = "localsongs"
 
-# keep an in-memory list of the cached files, so that we don't even
-# have to check whether a cache file exists on the disk
-_available_cache_files = set()
+NAMESPACE_IMAGE = "image"
+NAMESPACE_REQUEST = "request"
+NAMESPACE_LOCALSONGS = "localsongs"
+
+MEMORY_CACHE_MAX_SIZE = 64 * 2 ** 20
+MEMORY_CACHE_MAX_ENTRIES = 4096
+
+# how long the writer waits for other puts before committing a batch
+WRITER_BATCH_DELAY = 0.25
+
+# Requests are stored as a version byte followed by the zlib compressed
+# marshal dump of the result; entries written as plain JSON (before this format
+# existed) start with '[' or '{' instead and are still decoded
+REQUEST_FORMAT_VERSION = 1
+REQUEST_MARSHAL_VERSION = 4
+REQUEST_COMPRESSION_LEVEL = 6
+
+# Time to live (seconds) of the cached requests, by request name prefix.
+# Expired requests are still served, but should be refreshed in background;
+# requests not listed here never expire
+REQUEST_TTLS = {
+    "mb-search-": 7 * 24 * 3600, # search results
+    "fetch-artist-": 14 * 24 * 3600, # artist discography
+    "ytmusic-search-youtube-album-": 30 * 24 * 3600, # youtube album lookup
+}
+
+# Images known not to exist (e.g. no cover on the Cover Art Archive) are
+# stored as empty entries; they are not looked for again until they expire
+MISSING_IMAGE = b""
+MISSING_IMAGE_TTL = 7 * 24 * 3600
+
+# namespace -> {"memory_hits": ..., "disk_hits": ..., "negative_hits": ..., "misses": ...}
+_stats: Dict[str, Dict[str, int]] = {}
+
+# obsolete paths being deleted in background
+_deleting_paths = set()
+
+# limit (bytes, None or 0 means unlimited) of the local songs snapshot:
+# if it's exceeded the snapshot is emptied and not written anymore
+# (until the next start or clear), as the library would be only partially
+# stored in it anyway
+_localsongs_max_size: Optional[int] = None
+_localsongs_over_limit = False
+
+# ============ BACKENDS ===============
+# Where (and how) cache entries are stored
+# =====================================
+
+class CacheBackend:
+    def load(self):
+        pass
+
+    def close(self):
+        pass
+
+    def has(self, key: str) -> bool:
+        raise NotImplementedError("has() must be implemented by CacheBackend subclasses")
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError("get() must be implemented by CacheBackend subclasses")
+
+    def touch(self, key: str):
+        pass # records an access served by the memory cache (for the eviction order)
+
+    def put(self, key: str, data: bytes, namespace: str):
+        raise NotImplementedError("put() must be implemented by CacheBackend subclasses")
+
+    def put_many(self, entries: List[Tuple[str, bytes, str]]):
+        for key, data, namespace in entries:
+            self.put(key, data, namespace)
+
+    def remove(self, key: str):
+        raise NotImplementedError("remove() must be implemented by CacheBackend subclasses")
+
+    def clear(self):
+        raise NotImplementedError("clear() must be implemented by CacheBackend subclasses")
+
+    def set_limit(self, namespace: str, max_size: Optional[int]):
+        pass # no eviction by default
+
+    def mtime(self, key: str) -> Optional[int]:
+        return None # unknown
+
+    def namespace_size(self, namespace: str) -> int:
+        return 0
+
+    def disk_size(self) -> Optional[int]:
+        return None # unknown
+
+    def obsolete_paths(self) -> List[Path]:
+        return [] # paths not used anymore, to delete in background
+
+
+class FileCacheBackend(CacheBackend):
+    # Legacy layout: one file per entry in a flat directory
+
+    def __init__(self, path: Path):
+        self.path = path
+        # keep an in-memory list of the cached files, so that we don't even
+        # have to check whether a cache file exists on the disk
+        # key -> (namespace, size)
+        self.keys: Dict[str, Tuple[str, int]] = {}
+        # namespace -> size of the files (bytes)
+        self.sizes: Dict[str, int] = {}
+
+    def load(self):
+        debug("Loading available cache files")
+        for f in self.path.iterdir():
+            if f.is_file():
+                self._add(f.name, _guess_namespace(f.name), f.stat().st_size)
+
+    def has(self, key: str) -> bool:
+        return key in self.keys
+
+    def get(self, key: str) -> Optional[bytes]:
+        if key not in self.keys:
+            return None # for sure is not on the disk
+        p = Path(self.path, key)
+        if not p.exists():
+            return None
+        with p.open("rb") as f:
+            return f.read()
+
+    def put(self, key: str, data: bytes, namespace: str):
+        with Path(self.path, key).open("wb") as f:
+            f.write(data)
+        self._discard(key)
+        self._add(key, namespace, len(data))
+
+    def remove(self, key: str):
+        Path(self.path, key).unlink(missing_ok=True)
+        self._discard(key)
+
+    def clear(self):
+        for key in self.keys:
+            debug(f"Removing {key}")
+            Path(self.path, key).unlink(missing_ok=True)
+        self.keys.clear()
+        self.sizes.clear()
+
+    def mtime(self, key: str) -> Optional[int]:
+        if key not in self.keys:
+            return None
+        try:
+            return int(Path(self.path, key).stat().st_mtime)
+        except OSError:
+            return None
+
+    def namespace_size(self, namespace: str) -> int:
+        return self.sizes.get(namespace, 0)
+
+    def disk_size(self) -> Optional[int]:
+        return sum(self.sizes.values())
+
+    def _add(self, key: str, namespace: str, size: int):
+        self.keys[key] = (namespace, size)
+        self.sizes[namespace] = self.sizes.get(namespace, 0) + size
+
+    def _discard(self, key: str):
+        if key in self.keys:
+            namespace, size = self.keys.pop(key)
+            self.sizes[namespace] -= size
+
+
+class PackShard:
+    # A single append-only data file: each record is the key followed by
+    # its data, or by nothing for a tombstone (removed key)
+
+    # key length, data length
+    RECORD_HEADER = struct.Struct("<HI")
+    TOMBSTONE = 0xFFFFFFFF
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.data = None
+        self.data_size = 0
+        self.garbage = 0
+        # namespace -> size of the live entries (bytes)
+        self.sizes: Dict[str, int] = {}
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch()
+        self.data = self.path.open("r+b")
+        self.data_size = self.data.seek(0, os.SEEK_END)
+
+    def close(self):
+        if self.data:
+            self.data.close()
+            self.data = None
+
+    def read(self, offset: int, length: int) -> bytes:
+        self.data.seek(offset)
+        return self.data.read(length)
+
+    def append(self, key: str, data: Optional[bytes], flush=True) -> int:
+        key_bytes = key.encode()
+        self.data.seek(self.data_size)
+        self.data.write(PackShard.RECORD_HEADER.pack(
+            len(key_bytes), len(data) if data is not None else PackShard.TOMBSTONE))
+        self.data.write(key_bytes)
+        offset = self.data.tell()
+        if data is not None:
+            self.data.write(data)
+        if flush:
+            self.data.flush()
+        self.data_size = self.data.tell()
+        return offset
+
+    def flush(self):
+        self.data.flush()
+
+    def truncate(self, size: int):
+        self.data.truncate(size)
+        self.data_size = size
+
+    def records(self, start: int, end: int):
+        # Yields (key, payload offset, payload length or None for tombstones)
+        # of the records between start and end, reading with a dedicated
+        # handle so that the shard can be used meanwhile.
+        # Returns the position of the end of the last complete record
+        pos = start
+        with self.path.open("rb") as f:
+            f.seek(pos)
+            while pos < end:
+                header = f.read(PackShard.RECORD_HEADER.size)
+                if len(header) < PackShard.RECORD_HEADER.size:
+                    break
+                key_length, length = PackShard.RECORD_HEADER.unpack(header)
+                key_bytes = f.read(key_length)
+                offset = pos + len(header) + key_length
+                if length == PackShard.TOMBSTONE:
+                    length = None
+                record_end = offset + (length or 0)
+                if len(key_bytes) < key_length or record_end > end:
+                    break
+                yield key_bytes.decode(), offset, length
+                pos = record_end
+                f.seek(pos)
+        return pos
+
+    @staticmethod
+    def record_size(key: str, length: int):
+        return PackShard.RECORD_HEADER.size + len(key.encode()) + length
+
+
+class PackedCacheBackend(CacheBackend):
+    # The entries are appended to data files (shards) spread among hashed
+    # subdirectories; the offsets of the live entries are kept in a single
+    # index snapshot, which is read in one shot.
+    # Everything lives in a generation directory: clearing the cache just
+    # switches to a new (empty) generation, the old ones are deleted later.
+    # If the snapshot is missing or stale (records appended after it was
+    # saved) the shards are scanned in background: meanwhile the entries
+    # already known are served and the others are simply misses.
+    # Each namespace can be given a size budget: when it is exceeded the least
+    # recently accessed entries of that namespace are evicted.
+
+    GENERATION_DIRNAME_PREFIX = "generation-"
+    SHARDS_DIRNAME = "shards"
+    SHARD_FILENAME = "cache.pack"
+    SHARD_COUNT = 16
+    INDEX_FILENAME = "cache.index"
+    INDEX_VERSION = 1
+
+    # compact a shard on close if at least half of it is garbage
+    MIN_COMPACT_GARBAGE = 4 * 2 ** 20
+
+    # when evicting, free some more space than strictly needed so that
+    # the eviction does not run again on the next put
+    EVICTION_TARGET_RATIO = 0.9
+
+    # index entry fields
+    SHARD, OFFSET, LENGTH, NAMESPACE, ATIME, MTIME = range(6)
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.generation = 0
+        self.generation_path: Optional[Path] = None
+        self.index_path: Optional[Path] = None
+        self.shards: List[PackShard] = []
+        self.opened = False
+        # key -> [shard, payload offset, payload length, namespace, last access, write time]
+        self.index: Dict[str, List] = {}
+        # incremented on each access, orders the entries by last access
+        # (a timestamp would have ties, e.g. between the entries put together)
+        self.clock = 0
+        # namespace -> max size (bytes)
+        self.limits: Dict[str, int] = {}
+        # shard -> (start, end) of the records not in the index snapshot yet
+        self.unindexed: Dict[int, Tuple[int, int]] = {}
+        # keys put/removed while their shard is being scanned: the scan
+        # must not override them with older records
+        self.touched = set()
+        self.scanner: Optional[threading.Thread] = None
+        self.lock = threading.RLock()
+
+    def load(self):
+        with self.lock:
+            generations = self._generations()
+            first_run = not generations
+            generation = max(generations) if generations else 0
+            self._open_generation(generation)
+
+            indexed_sizes = self._load_index()
+            for i, shard in enumerate(self.shards):
+                if indexed_sizes.get(i, 0) < shard.data_size:
+                    self.unindexed[i] = (indexed_sizes.get(i, 0), shard.data_size)
+
+            self.opened = True
+
+            debug(f"CACHE: loaded index of {len(self.index)} entries")
+
+            if first_run:
+                self._migrate_legacy_files()
+
+            for namespace in self.limits:
+                self._evict_if_needed(namespace)
+
+            if self.unindexed:
+                debug(f"CACHE: index snapshot is stale for {len(self.unindexed)} shards, scanning them in background")
+                self.scanner = threading.Thread(target=self._scan, name="CacheScanner", daemon=True)
+                self.scanner.start()
+
+    def close(self):
+        if self.scanner:
+            self.scanner.join()
+        with self.lock:
+            if not self.opened:
+                return
+            for i, shard in enumerate(self.shards):
+                if shard.garbage > PackedCacheBackend.MIN_COMPACT_GARBAGE and shard.garbage > shard.data_size / 2:
+                    self.compact(i)
+            self._save_index()
+            for shard in self.shards:
+                shard.close()
+            self.opened = False
+
+    def has(self, key: str) -> bool:
+        return key in self.index
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            entry[PackedCacheBackend.ATIME] = self._tick()
+            return self.shards[entry[PackedCacheBackend.SHARD]].read(
+                entry[PackedCacheBackend.OFFSET], entry[PackedCacheBackend.LENGTH])
+
+    def touch(self, key: str):
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is not None:
+                entry[PackedCacheBackend.ATIME] = self._tick()
+
+    def put(self, key: str, data: bytes, namespace: str):
+        self.put_many([(key, data, namespace)])
+
+    def put_many(self, entries: List[Tuple[str, bytes, str]]):
+        with self.lock:
+            now = int(time.time())
+            dirty_shards = set()
+            for key, data, namespace in entries:
+                self._discard(key)
+                i = _shard_of(key)
+                self.index[key] = [i, self.shards[i].append(key, data, flush=False), len(data), namespace, self._tick(), now]
+                self.shards[i].sizes[namespace] = self.shards[i].sizes.get(namespace, 0) + len(data)
+                dirty_shards.add(i)
+                if i in self.unindexed:
+                    self.touched.add(key)
+            for i in dirty_shards:
+                self.shards[i].flush()
+            for namespace in set(namespace for _, _, namespace in entries):
+                self._evict_if_needed(namespace)
+
+    def remove(self, key: str):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key: str, flush=True):
+        # Returns the shard of the tombstone, if any
+        if key not in self.index:
+            return None
+        self._discard(key)
+        i = _shard_of(key)
+        self.shards[i].append(key, None, flush=flush)
+        del self.index[key]
+        if i in self.unindexed:
+            self.touched.add(key)
+        return i
+
+    def clear(self):
+        with self.lock:
+            self.index.clear()
+            # stop the scan as well: whatever it would find is gone
+            self.unindexed.clear()
+            self.touched.clear()
+            for shard in self.shards:
+                shard.close()
+            # the old generation is left there, see obsolete_paths()
+            self._open_generation(self.generation + 1)
+            self._save_index()
+            debug(f"CACHE: switched to generation {self.generation}")
+
+    def set_limit(self, namespace: str, max_size: Optional[int]):
+        with self.lock:
+            if max_size:
+                self.limits[namespace] = max_size
+            else:
+                self.limits.pop(namespace, None)
+            if self.opened:
+                self._evict_if_needed(namespace)
+
+    def mtime(self, key: str) -> Optional[int]:
+        entry = self.index.get(key)
+        return entry[PackedCacheBackend.MTIME] if entry else None
+
+    def namespace_size(self, namespace: str) -> int:
+        return sum(shard.sizes.get(namespace, 0) for shard in self.shards)
+
+    def disk_size(self) -> Optional[int]:
+        return sum(shard.data_size for shard in self.shards)
+
+    def obsolete_paths(self) -> List[Path]:
+        return [self._generation_path(generation) for generation in self._generations()
+                if generation != self.generation]
+
+    def compact(self, i: int):
+        with self.lock:
+            shard = self.shards[i]
+            debug(f"CACHE: compacting shard {i} ({shard.garbage}/{shard.data_size} bytes of garbage)")
+            tmp = PackShard(shard.path.with_suffix(".tmp"))
+            tmp.open()
+            tmp.truncate(0)
+            for key, entry in self.index.items():
+                if entry[PackedCacheBackend.SHARD] != i:
+                    continue
+                data = shard.read(entry[PackedCacheBackend.OFFSET], entry[PackedCacheBackend.LENGTH])
+                entry[PackedCacheBackend.OFFSET] = tmp.append(key, data, flush=False)
+            tmp.close()
+            shard.close()
+            os.replace(tmp.path, shard.path)
+            shard.open()
+            shard.garbage = 0
+
+    def _generation_path(self, generation: int) -> Path:
+        return self.path / f"{PackedCacheBackend.GENERATION_DIRNAME_PREFIX}{generation}"
+
+    def _generations(self) -> List[int]:
+        generations = []
+        for f in self.path.iterdir():
+            if f.is_dir() and f.name.startswith(PackedCacheBackend.GENERATION_DIRNAME_PREFIX):
+                try:
+                    generations.append(int(f.name[len(PackedCacheBackend.GENERATION_DIRNAME_PREFIX):]))
+                except ValueError:
+                    pass
+        return generations
+
+    def _open_generation(self, generation: int):
+        self.generation = generation
+        self.generation_path = self._generation_path(generation)
+        self.generation_path.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.generation_path / PackedCacheBackend.INDEX_FILENAME
+        self.shards = [PackShard(self.generation_path / PackedCacheBackend.SHARDS_DIRNAME / f"{i:02x}" / PackedCacheBackend.SHARD_FILENAME)
+                       for i in range(PackedCacheBackend.SHARD_COUNT)]
+        for shard in self.shards:
+            shard.open()
+
+    def _evict_if_needed(self, namespace: str):
+        max_size = self.limits.get(namespace)
+        if not max_size:
+            return
+        size = self.namespace_size(namespace)
+        if size <= max_size:
+            return
+
+        target_size = max_size * PackedCacheBackend.EVICTION_TARGET_RATIO
+        debug(f"CACHE: {namespace} size ({size}) exceeds limit ({max_size}), evicting")
+
+        # least recently accessed first
+        entries = sorted([(entry[PackedCacheBackend.ATIME], key, entry[PackedCacheBackend.LENGTH])
+                          for key, entry in self.index.items()
+                          if entry[PackedCacheBackend.NAMESPACE] == namespace])
+        evicted = 0
+        dirty_shards = set()
+        for _, key, length in entries:
+            if size <= target_size:
+                break
+            dirty_shards.add(self._remove(key, flush=False))
+            size -= length
+            evicted += 1
+        for i in dirty_shards:
+            self.shards[i].flush()
+        debug(f"CACHE: evicted {evicted} {namespace} entries")
+
+    def _discard(self, key: str):
+        entry = self.index.get(key)
+        if entry is not None:
+            length = entry[PackedCacheBackend.LENGTH]
+            shard = self.shards[entry[PackedCacheBackend.SHARD]]
+            shard.garbage += PackShard.record_size(key, length)
+            shard.sizes[entry[PackedCacheBackend.NAMESPACE]] -= length
+
+    def _load_index(self) -> Dict[int, int]:
+        # Returns the size of each shard covered by the snapshot
+        if not self.index_path.exists():
+            return {}
+        try:
+            index = json.loads(self.index_path.read_bytes())
+        except (OSError, ValueError) as e:
+            print(f"WARN: failed to load cache index: {e}")
+            return {}
+        if index.get("version") != PackedCacheBackend.INDEX_VERSION:
+            return {}
+
+        indexed_sizes = {}
+        for i, shard_info in enumerate(index.get("shards", [])):
+            if i >= len(self.shards):
+                break
+            if shard_info["data_size"] > self.shards[i].data_size:
+                # the shard is shorter than expected: not trustworthy,
+                # rebuild its part of the index from scratch
+                continue
+            indexed_sizes[i] = shard_info["data_size"]
+            self.shards[i].garbage = shard_info["garbage"]
+            self.shards[i].sizes = shard_info["sizes"]
+
+        self.index = {key: entry for key, entry in index.get("entries", {}).items()
+                      if entry[PackedCacheBackend.SHARD] in indexed_sizes}
+        # (the accesses go on from the last one)
+        self.clock = max((entry[PackedCacheBackend.ATIME] for entry in self.index.values()), default=0)
+        return indexed_sizes
+
+    def _tick(self) -> int:
+        self.clock += 1
+        return self.clock
+
+    def _save_index(self):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with tmp_path.open("w") as f:
+            json.dump({
+                "version": PackedCacheBackend.INDEX_VERSION,
+                "shards": [{
+                    # the records not scanned yet are not covered by this snapshot
+                    "data_size": self.unindexed[i][0] if i in self.unindexed else shard.data_size,
+                    "garbage": shard.garbage,
+                    "sizes": shard.sizes,
+                } for i, shard in enumerate(self.shards)],
+                "entries": self.index,
+            }, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _scan(self):
+        for i, (start, end) in list(self.unindexed.items()):
+            shard = self.shards[i]
+            debug(f"CACHE: scanning shard {i} from {start} to {end}")
+            now = int(time.time())
+            records = shard.records(start, end)
+            valid_end = start
+            while True:
+                try:
+                    key, offset, length = next(records)
+                except StopIteration as stop:
+                    valid_end = stop.value
+                    break
+                with self.lock:
+                    if i not in self.unindexed:
+                        # cleared meanwhile
+                        break
+                    if key in self.touched:
+                        # already overridden by a newer put/remove
+                        shard.garbage += PackShard.record_size(key, length or 0)
+                        continue
+                    self._discard(key)
+                    if length is None:
+                        self.index.pop(key, None)
+                    else:
+                        namespace = _guess_namespace(key)
+                        self.index[key] = [i, offset, length, namespace, self._tick(), now]
+                        shard.sizes[namespace] = shard.sizes.get(namespace, 0) + length
+
+            with self.lock:
+                if i not in self.unindexed:
+                    continue
+                if valid_end < end:
+                    # partially written record (e.g. crash)
+                    print(f"WARN: corrupted cache shard {i} at {valid_end}")
+                    if shard.data_size == end:
+                        shard.truncate(valid_end)
+                    else:
+                        shard.garbage += end - valid_end
+                del self.unindexed[i]
+                self.touched = set(key for key in self.touched if _shard_of(key) in self.unindexed)
+
+        with self.lock:
+            debug(f"CACHE: scan completed, {len(self.index)} entries")
+            for namespace in self.limits:
+                self._evict_if_needed(namespace)
+            if self.opened:
+                self._save_index()
+
+    def _migrate_legacy_files(self):
+        legacy_files = [f for f in self.path.iterdir() if f.is_file() and f.suffix != ".tmp"]
+        if not legacy_files:
+            return
+        debug(f"CACHE: migrating {len(legacy_files)} legacy cache files")
+        for f in legacy_files:
+            try:
+                self.put(f.name, f.read_bytes(), _guess_namespace(f.name))
+                f.unlink()
+            except OSError as e:
+                print(f"WARN: failed to migrate cache file '{f}': {e}")
+        self._save_index()
+
+
+def _shard_of(key: str) -> int:
+    return zlib.crc32(key.encode()) % PackedCacheBackend.SHARD_COUNT
+
+
+# ============ MEMORY ===============
+# Keeps the most recently used entries
+# already decoded, in front of the backend
+# ===================================
+
+class MemoryCache:
+    def __init__(self, max_size: int, max_entries: int):
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.size = 0
+        # key -> (value, size); most recently used last
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: Any, size: int):
+        with self.lock:
+            self._remove(key)
+            if size > self.max_size:
+                return # would evict everything else
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size or len(self.entries) > self.max_entries:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def remove(self, key: str):
+        with self.lock:
+            self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
 
-def initialize(images: bool, requests: bool, localsongs: bool):
+# ============ WRITER ===============
+# Commits the puts to the backend in
+# batches, from a background thread
+# ===================================
+
+class CacheWriter(threading.Thread):
+    def __init__(self, backend: CacheBackend, memory: MemoryCache):
+        super().__init__(name="CacheWriter", daemon=True)
+        self.backend = backend
+        self.memory = memory
+        # key -> (namespace, value, encoder); values are encoded by the writer,
+        # a None encoder means that the key has to be removed instead
+        self.pending: Dict[str, Tuple[str, Any, Callable[[Any], Tuple[bytes, int]]]] = {}
+        # the batch being committed right now: still visible to readers
+        self.committing: Dict[str, Tuple[str, Any, Callable[[Any], Tuple[bytes, int]]]] = {}
+        self.stopped = False
+        self.flushing = 0
+        self.condition = threading.Condition()
+
+    def submit(self, key: str, namespace: str, value: Any, encoder: Callable[[Any], Tuple[bytes, int]]):
+        with self.condition:
+            self.pending[key] = (namespace, value, encoder)
+            self.condition.notify_all()
+
+    def submit_removal(self, key: str, namespace: str):
+        self.submit(key, namespace, None, None)
+
+    def lookup(self, key: str) -> Optional[Any]:
+        with self.condition:
+            entry = self.pending.get(key) or self.committing.get(key)
+            return entry[1] if entry else None
+
+    def discard(self, key: str = None):
+        # drop a pending put (or all of them), e.g. because of a remove/clear
+        with self.condition:
+            if key is None:
+                self.pending.clear()
+            else:
+                self.pending.pop(key, None)
+
+    def flush(self):
+        debug("CACHE: flushing pending writes")
+        with self.condition:
+            self.flushing += 1
+            self.condition.notify_all()
+            while self.pending or self.committing:
+                self.condition.wait()
+            self.flushing -= 1
+
+    def stop(self):
+        self.flush()
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                # give some time to other puts to join this batch
+                deadline = time.monotonic() + WRITER_BATCH_DELAY
+                while not self.flushing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                self.committing, self.pending = self.pending, {}
+
+            self._commit(self.committing)
+
+            with self.condition:
+                self.committing = {}
+                self.condition.notify_all()
+
+    def _commit(self, batch: Dict[str, Tuple[str, Any, Callable[[Any], Tuple[bytes, int]]]]):
+        debug(f"CACHE: committing {len(batch)} entries")
+        entries = []
+        removals = []
+        for key, (namespace, value, encoder) in batch.items():
+            if encoder is None:
+                self.memory.remove(key)
+                removals.append(key)
+                continue
+            try:
+                data, size = encoder(value)
+            except Exception as e:
+                print(f"WARN: failed to encode cache entry '{key}': {e}")
+                continue
+            if namespace != NAMESPACE_LOCALSONGS:
+                self.memory.put(key, value, size)
+            entries.append((key, data, namespace))
+        try:
+            self.backend.put_many(entries)
+            for key in removals:
+                self.backend.remove(key)
+        except OSError as e:
+            print(f"WARN: failed to write cache entries: {e}")
+
+
+# ========= DELETE OBSOLETE PATHS =====
+# Delete the files not used anymore by
+# the cache (e.g. cleared generations)
+# =====================================
+
+class DeleteCachePathsWorker(Worker):
+    def __init__(self, paths: List[Path]):
+        super().__init__(priority=Worker.PRIORITY_IDLE)
+        self.paths = paths
+
+    def run(self):
+        for path in self.paths:
+            debug(f"CACHE: deleting {path}")
+            shutil.rmtree(path, ignore_errors=True)
+            _deleting_paths.discard(path)
+
+
+def _delete_obsolete_paths():
+    if not workers.worker_scheduler:
+        return # deleted on next startup
+    paths = [path for path in _backend.obsolete_paths() if path not in _deleting_paths]
+    if not paths:
+        return
+    _deleting_paths.update(paths)
+    workers.schedule(DeleteCachePathsWorker(paths))
+
+
+# ========= CLEAR =====================
+# Clear the cache (or just the local songs)
+# without blocking the GUI thread
+# =====================================
+
+class ClearCacheWorker(Worker):
+    def __init__(self, localsongs_only: bool):
+        super().__init__()
+        self.localsongs_only = localsongs_only
+
+    def run(self):
+        if self.localsongs_only:
+            clear_localsongs()
+        else:
+            clear()
+
+
+def clear_background(finished_callback=None, priority=Worker.PRIORITY_HIGH):
+    worker = ClearCacheWorker(localsongs_only=False)
+    worker.priority = priority
+    if finished_callback:
+        worker.finished.connect(finished_callback)
+    workers.schedule(worker)
+
+
+def clear_localsongs_background(finished_callback=None, priority=Worker.PRIORITY_HIGH):
+    worker = ClearCacheWorker(localsongs_only=True)
+    worker.priority = priority
+    if finished_callback:
+        worker.finished.connect(finished_callback)
+    workers.schedule(worker)
+
+
+# ========= LOCAL SONGS SNAPSHOT ======
+# The local songs (info of the mp3 files and listings of the directories)
+# are stored in a SQLite database, a row for each file/directory:
+# only the rows that changed are written, and rows are read when needed
+# instead of loading everything at once
+# =====================================
+
+class LocalSongsSnapshot:
+    DIRNAME = "localsongs-snapshot"
+    FILENAME = "localsongs.sqlite"
+    VERSION = 1
+
+    FILE_FIELDS = ["path", "length", "artist", "album", "song", "track_num", "year",
+                   "size", "mtime_ns", "inode", "image_offset", "image_length", "image_fingerprint"]
+
+    # lists of paths are stored joined by a character that can't be in a path
+    PATHS_SEPARATOR = "\0"
+
+    def __init__(self, path: Path):
+        self.path = path / LocalSongsSnapshot.DIRNAME / LocalSongsSnapshot.FILENAME
+        self.connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.RLock()
+
+    def open(self):
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != LocalSongsSnapshot.VERSION:
+                debug(f"CACHE: creating local songs snapshot (version {version} found)")
+                self.connection.execute("DROP TABLE IF EXISTS files")
+                self.connection.execute("DROP TABLE IF EXISTS directories")
+                self.connection.execute(
+                    f"CREATE TABLE files ({', '.join(LocalSongsSnapshot.FILE_FIELDS)}, "
+                    f"PRIMARY KEY (path)) WITHOUT ROWID")
+                self.connection.execute(
+                    "CREATE TABLE directories (path, mtime_ns, dirs, files, "
+                    "PRIMARY KEY (path)) WITHOUT ROWID")
+                self.connection.execute(f"PRAGMA user_version={LocalSongsSnapshot.VERSION}")
+
+    def close(self):
+        with self.lock:
+            if self.connection:
+                self.connection.close()
+                self.connection = None
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
+
+    def count(self, table: str) -> int:
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def get(self, table: str, path: str) -> Optional[dict]:
+        with self.lock:
+            row = self.connection.execute(f"SELECT * FROM {table} WHERE path = ?", (path, )).fetchone()
+        return self._decode(table, row) if row else None
+
+    def items(self, table: str) -> Iterator[Tuple[str, dict]]:
+        with self.lock:
+            rows = self.connection.execute(f"SELECT * FROM {table}").fetchall()
+        for row in rows:
+            yield row[0], self._decode(table, row)
+
+    def update(self, files: List[dict], removed_files: List[str],
+               directories: Dict[str, dict], removed_directories: List[str]):
+        file_rows = [[info.get(field) for field in LocalSongsSnapshot.FILE_FIELDS] for info in files]
+        inode_column = LocalSongsSnapshot.FILE_FIELDS.index("inode")
+        for row in file_rows:
+            if row[inode_column] is not None and row[inode_column] >= 2 ** 63:
+                row[inode_column] -= 2 ** 64 # (sqlite integers are signed)
+        directory_rows = [(path, listing["mtime_ns"],
+                           LocalSongsSnapshot.PATHS_SEPARATOR.join(listing["dirs"]),
+                           LocalSongsSnapshot.PATHS_SEPARATOR.join(listing["files"]))
+                          for path, listing in directories.items()]
+
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany("DELETE FROM files WHERE path = ?",
+                                            [(path, ) for path in removed_files])
+                self.connection.executemany(
+                    f"INSERT OR REPLACE INTO files VALUES ({', '.join('?' * len(LocalSongsSnapshot.FILE_FIELDS))})",
+                    file_rows)
+                self.connection.executemany("DELETE FROM directories WHERE path = ?",
+                                            [(path, ) for path in removed_directories])
+                self.connection.executemany("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)",
+                                            directory_rows)
+        debug(f"CACHE: local songs snapshot updated ({len(file_rows)} files, {len(removed_files)} removed, "
+              f"{len(directory_rows)} directories, {len(removed_directories)} removed)")
+
+    def clear(self):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.execute("DELETE FROM files")
+                self.connection.execute("DELETE FROM directories")
+
+    def data_size(self) -> int:
+        # bytes of the pages in use (the file doesn't shrink when rows are deleted)
+        with self.lock:
+            page_count = self.connection.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+            page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def disk_size(self) -> int:
+        size = 0
+        for suffix in ["", "-wal"]:
+            try:
+                size += os.path.getsize(f"{self.path}{suffix}")
+            except OSError:
+                pass
+        return size
+
+    def _decode(self, table: str, row: tuple) -> dict:
+        if table == "files":
+            info = dict(zip(LocalSongsSnapshot.FILE_FIELDS, row))
+            if info["inode"] is not None and info["inode"] < 0:
+                info["inode"] += 2 ** 64
+            return info
+
+        def paths(joined: str):
+            return joined.split(LocalSongsSnapshot.PATHS_SEPARATOR) if joined else []
+
+        return {"mtime_ns": row[1], "dirs": paths(row[2]), "files": paths(row[3])}
+
+
+class LocalSongsSnapshotTable(Mapping):
+    # Read only view of a table of the snapshot: rows are read when accessed
+    def __init__(self, snapshot: LocalSongsSnapshot, table: str):
+        self.snapshot = snapshot
+        self.table = table
+
+    def __getitem__(self, path: str) -> dict:
+        value = self.snapshot.get(self.table, path)
+        if value is None:
+            raise KeyError(path)
+        return value
+
+    def get(self, path: str, default=None):
+        value = self.snapshot.get(self.table, path)
+        return default if value is None else value
+
+    def __contains__(self, path) -> bool:
+        return self.snapshot.get(self.table, path) is not None
+
+    def __iter__(self):
+        return (path for path, _ in self.snapshot.items(self.table))
+
+    def items(self):
+        return self.snapshot.items(self.table)
+
+    def values(self):
+        # (Mapping.values() would read the rows one by one)
+        return (value for _, value in self.snapshot.items(self.table))
+
+    def __len__(self):
+        return self.snapshot.count(self.table)
+
+
+# Encoders return the data to store and the (approximate) size of the value
+# once decoded, used to account for it in the memory cache
+
+def _encode_bytes(value) -> Tuple[bytes, int]:
+    return value, len(value)
+
+
+# The requests are kept in memory (and pending in the writer) as marshal
+# bytes, not as the objects: each get returns a fresh copy, so that the
+# callers modifying the result don't modify the cached request
+
+def _encode_request(value) -> Tuple[bytes, int]:
+    return _compress_request(marshal.dumps(value, REQUEST_MARSHAL_VERSION))
+
+
+def _decode_request(data: bytes) -> Tuple[Any, int]:
+    raw = _decompress_request(data)
+    return marshal.loads(raw), len(raw)
+
+
+def _compress_request(raw: bytes) -> Tuple[bytes, int]:
+    return bytes([REQUEST_FORMAT_VERSION]) + zlib.compress(raw, REQUEST_COMPRESSION_LEVEL), len(raw)
+
+
+def _decompress_request(data: bytes) -> bytes:
+    if data[:1] == bytes([REQUEST_FORMAT_VERSION]):
+        return zlib.decompress(data[1:])
+    # legacy: plain JSON
+    return marshal.dumps(json.loads(data), REQUEST_MARSHAL_VERSION)
+
+
+def _guess_namespace(key: str):
+    if key == _LOCALSONGS_CACHE_FILENAME:
+        return NAMESPACE_LOCALSONGS
+    if key.startswith("mb-") or key.startswith("fetch-") or key.startswith("ytmusic-"):
+        return NAMESPACE_REQUEST
+    return NAMESPACE_IMAGE
+
+
+def initialize(images: bool, requests: bool, localsongs: bool, backend_class=PackedCacheBackend):
     global _cache_path
     _cache_path = app_cache_path()
     if not _cache_path.exists():
@@ -26,13 +1072,58 @@ def initialize(images: bool, requests: bool, localsongs: bool):
     enable_images_cache(images)
     enable_requests_cache(requests)
     enable_localsongs_cache(localsongs)
-    _load_cache()
+    _load_cache(backend_class)
+
+def _load_cache(backend_class):
+    global _backend, _memory, _writer, _localsongs_snapshot
+    _memory = MemoryCache(MEMORY_CACHE_MAX_SIZE, MEMORY_CACHE_MAX_ENTRIES)
+    _backend = backend_class(_cache_path)
+    _backend.load()
+    _writer = CacheWriter(_backend, _memory)
+    _writer.start()
+    _localsongs_snapshot = LocalSongsSnapshot(_cache_path)
+    try:
+        _localsongs_snapshot.open()
+        _migrate_localsongs()
+    except sqlite3.Error as e:
+        print(f"WARN: failed to open local songs snapshot: {e}")
+        _localsongs_snapshot = None
+    # e.g. generations left there by a clear() not completed
+    _delete_obsolete_paths()
+
+def _migrate_localsongs():
+    # local songs stored as a single JSON entry before the snapshot existed
+    data = _backend.get(_LOCALSONGS_CACHE_FILENAME)
+    if data is None:
+        return
+    if _localsongs_snapshot.is_empty():
+        debug("CACHE: moving local songs to the snapshot")
+        try:
+            localsongs = json.loads(data)
+        except ValueError:
+            localsongs = {}
+        if "files" not in localsongs:
+            localsongs = {"files": localsongs} # old format: just the files
+        files = [dict(info, path=path) for path, info in localsongs["files"].items()]
+        _localsongs_snapshot.update(files, [], localsongs.get("directories", {}), [])
+    _writer.submit_removal(_LOCALSONGS_CACHE_FILENAME, NAMESPACE_LOCALSONGS)
+
+def _count(namespace: str, what: str):
+    counters = _stats.setdefault(namespace, {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0, "misses": 0})
+    counters[what] += 1
+
+def flush():
+    if _writer:
+        _writer.flush()
 
-def _load_cache():
-    debug("Loading available cache files")
-    for f in _cache_path.iterdir():
-        debug(f"CACHE: add {str(f.absolute())}")
-        _available_cache_files.add(str(f.absolute()))
+def close():
+    debug("Closing cache")
+    if _writer:
+        _writer.stop()
+    if _backend:
+        _backend.close()
+    if _localsongs_snapshot:
+        _localsongs_snapshot.close()
 
 def enable_images_cache(enabled):
     global _images_caching
@@ -46,141 +1137,226 @@ def enable_localsongs_cache(enabled):
     global _localsongs_caching
     _localsongs_caching = enabled
 
+# Limits (bytes, None or 0 means unlimited)
+
+def set_images_cache_limit(max_size: Optional[int]):
+    _backend.set_limit(NAMESPACE_IMAGE, max_size)
+
+def set_requests_cache_limit(max_size: Optional[int]):
+    _backend.set_limit(NAMESPACE_REQUEST, max_size)
+
+def set_localsongs_cache_limit(max_size: Optional[int]):
+    global _localsongs_max_size
+    _localsongs_max_size = max_size
+
 # Utility
 
-def cache_size():
-    return get_folder_size(_cache_path)
+def cache_size() -> int:
+    # bytes occupied on the disk, without walking the cache folder
+    # unless the backend does not keep track of it
+    size = _backend.disk_size() if _backend else None
+    if size is None:
+        return get_folder_size(_cache_path)
+    return size + namespace_size(NAMESPACE_LOCALSONGS)
+
+def namespace_size(namespace: str) -> int:
+    size = _backend.namespace_size(namespace) if _backend else 0
+    if namespace == NAMESPACE_LOCALSONGS and _localsongs_snapshot:
+        size += _localsongs_snapshot.disk_size()
+    return size
 
 def clear():
+    global _localsongs_over_limit
     debug("Clearing cache")
-    _available_cache_files.clear()
-    for f in _cache_path.iterdir():
-        debug(f"Removing {f}")
-        f.unlink()
+    _writer.discard()
+    _writer.flush()
+    _memory.clear()
+    _backend.clear()
+    if _localsongs_snapshot:
+        _localsongs_snapshot.clear()
+    _localsongs_over_limit = False
+    _delete_obsolete_paths()
+
+def stats() -> Dict[str, Dict[str, int]]:
+    # per namespace hit/miss counters and size of the stored entries (bytes)
+    ret = {}
+    for namespace in [NAMESPACE_IMAGE, NAMESPACE_REQUEST, NAMESPACE_LOCALSONGS]:
+        counters = dict(_stats.get(namespace, {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0, "misses": 0}))
+        counters["size"] = namespace_size(namespace)
+        ret[namespace] = counters
+    return ret
 
 def has_file(file: str, lazy=True) -> bool:
-    p = Path(_cache_path, file)
-    path = str(p.absolute())
-    if lazy:
-        return path in _available_cache_files
-    return path in _available_cache_files and p.is_file()
+    return _writer.lookup(file) is not None or _backend.has(file)
 
 # Image
 
 def get_image(file: str) -> Optional[bytes]:
-    global _cache_path, _images_caching
+    global _images_caching
 
     # check whether this type of caching is enabled
     if not _images_caching:
         return None
-    # check whether the cache file should be there
-    p = Path(_cache_path, file)
-    path = str(p.absolute())
-    if path not in _available_cache_files:
+    data = _writer.lookup(file)
+    if data is None:
+        data = _memory.get(file)
+    if data is not None:
+        _backend.touch(file)
+        if data == MISSING_IMAGE:
+            debug(f"CACHE: hit [memory] missing image: {file}")
+            _count(NAMESPACE_IMAGE, "negative_hits")
+            return None
+        debug(f"CACHE: hit [memory] image: {file}")
+        _count(NAMESPACE_IMAGE, "memory_hits")
+        return data
+    data = _backend.get(file)
+    if data is None:
         debug(f"CACHE: miss image: {file}")
-        return None # for sure is not on the disk
-    # check whether the cache file is actually there
-    if p.exists():
-        debug(f"CACHE: hit image: {file}")
-        with p.open("rb") as f:
-            return f.read()
-    debug(f"CACHE: miss image: {file}")
-    return None
+        _count(NAMESPACE_IMAGE, "misses")
+        return None
+    _memory.put(file, data, len(data))
+    if data == MISSING_IMAGE:
+        debug(f"CACHE: hit missing image: {file}")
+        _count(NAMESPACE_IMAGE, "negative_hits")
+        return None
+    debug(f"CACHE: hit image: {file}")
+    _count(NAMESPACE_IMAGE, "disk_hits")
+    return data
 
-def put_image(file: str, data: bytes) -> Optional[bytes]:
-    global _cache_path, _images_caching
+def is_image_missing(file: str) -> bool:
+    # Whether the image is known not to exist (and such information
+    # is not expired yet), so that it's not worth fetching it again
+    global _images_caching
     if not _images_caching:
-        return None
-    p = Path(_cache_path, file)
-    path = str(p.absolute())
+        return False
+    data = _writer.lookup(file)
+    if data is not None:
+        return data == MISSING_IMAGE # just put
+    data = _memory.get(file)
+    if data is None:
+        data = _backend.get(file)
+    if data != MISSING_IMAGE:
+        return False
+    mtime = _backend.mtime(file)
+    return mtime is None or time.time() - mtime <= MISSING_IMAGE_TTL
+
+def put_image(file: str, data: Optional[bytes]):
+    global _images_caching
+    if not _images_caching:
+        return
+    if not data:
+        put_missing_image(file)
+        return
     debug(f"CACHE: put image: {file}")
-    # write to disk
-    if data:
-        with p.open("wb") as f:
-            f.write(data)
-    else:
-        p.touch() # null image
-    # write to memory
-    _available_cache_files.add(path)
+    _writer.submit(file, NAMESPACE_IMAGE, data, _encode_bytes)
+
+def put_missing_image(file: str):
+    global _images_caching
+    if not _images_caching:
+        return
+    debug(f"CACHE: put missing image: {file}")
+    _writer.submit(file, NAMESPACE_IMAGE, MISSING_IMAGE, _encode_bytes)
+
+# Thumbnail (pre-scaled covers, stored among the images)
+
+def _thumbnail_key(fingerprint: str, size: int):
+    return f"thumbnail-{size}-{fingerprint}"
+
+def get_thumbnail(fingerprint: str, size: int) -> Optional[bytes]:
+    return get_image(_thumbnail_key(fingerprint, size))
+
+def put_thumbnail(fingerprint: str, size: int, data: bytes):
+    put_image(_thumbnail_key(fingerprint, size), data)
 
 # Request
 
 def get_request(file: str) -> Optional[Union[list, dict]]:
-    global _cache_path, _requests_caching
+    global _requests_caching
     # check whether this type of caching is enabled
     if not _requests_caching:
         return None
-    # check whether the cache file should be there
-    p = Path(_cache_path, file)
-    path = str(p.absolute())
-    if path not in _available_cache_files:
+    raw = _writer.lookup(file)
+    if raw is None:
+        raw = _memory.get(file)
+    if raw is not None:
+        _backend.touch(file)
+        debug(f"CACHE: hit [memory] request: {file}")
+        _count(NAMESPACE_REQUEST, "memory_hits")
+        return marshal.loads(raw)
+    data = _backend.get(file)
+    if data is None:
         debug(f"CACHE: miss request: {file}")
-        return None # for sure is not on the disk
-    # check whether the cache file is actually there
-    if p.exists():
-        debug(f"CACHE: hit request: {file}")
-        with p.open("r") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return None # null image
-    debug(f"CACHE: miss request: {file}")
-    return None
+        _count(NAMESPACE_REQUEST, "misses")
+        return None
+    debug(f"CACHE: hit request: {file}")
+    _count(NAMESPACE_REQUEST, "disk_hits")
+    try:
+        raw = _decompress_request(data)
+        req = marshal.loads(raw)
+    except (ValueError, EOFError, TypeError, zlib.error) as e:
+        print(f"WARN: failed to decode cached request '{file}': {e}")
+        return None
+    _memory.put(file, raw, len(raw))
+    return req
+
+
+def is_request_expired(file: str) -> bool:
+    ttl = next((ttl for prefix, ttl in REQUEST_TTLS.items() if file.startswith(prefix)), None)
+    if ttl is None:
+        return False
+    if _writer.lookup(file) is not None:
+        return False # just put
+    mtime = _backend.mtime(file)
+    return mtime is not None and time.time() - mtime > ttl
 
 
 def put_request(file: str, data: Union[list, dict]):
-    global _cache_path, _requests_caching
+    global _requests_caching
     if not _requests_caching:
         return None
-    p = Path(_cache_path, file)
-    path = str(p.absolute())
     debug(f"CACHE: put request: {file}")
-    # write to disk
-    with p.open("w") as f:
-        json.dump(data, f)
-    # write to memory
-    _available_cache_files.add(path)
+    # (as it is now: the caller may modify data later)
+    _writer.submit(file, NAMESPACE_REQUEST, marshal.dumps(data, REQUEST_MARSHAL_VERSION), _compress_request)
 
 
 # Local songs
 
 def get_localsongs() -> Optional[dict]:
-    global _cache_path, _localsongs_caching
+    # {"files": {path: info}, "directories": {path: listing}},
+    # whose rows are read from the snapshot when accessed
+    global _localsongs_caching
     # check whether this type of caching is enabled
-    if not _localsongs_caching:
+    if not _localsongs_caching or not _localsongs_snapshot:
         return None
-    # check whether the cache file should be there
-    p = Path(_cache_path, _LOCALSONGS_CACHE_FILENAME)
-    path = str(p.absolute())
-    if path not in _available_cache_files:
-        debug(f"CACHE: miss local songs: {_LOCALSONGS_CACHE_FILENAME}")
-        return None # for sure is not on the disk
-    # check whether the cache file is actually there
-    if p.exists():
-        debug(f"CACHE: hit local songs: {_LOCALSONGS_CACHE_FILENAME}")
-        with p.open("r") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return None # null image
-    debug(f"CACHE: miss local songs: {_LOCALSONGS_CACHE_FILENAME}")
-    return None
+    if _localsongs_snapshot.is_empty():
+        debug("CACHE: miss local songs")
+        return None
+    debug("CACHE: hit local songs")
+    return {
+        "files": LocalSongsSnapshotTable(_localsongs_snapshot, "files"),
+        "directories": LocalSongsSnapshotTable(_localsongs_snapshot, "directories"),
+    }
 
 
-def put_localsongs(data: dict):
-    global _cache_path, _localsongs_caching
-    if not _localsongs_caching:
+def update_localsongs(files: List[dict], removed_files: List[str],
+                      directories: Dict[str, dict], removed_directories: List[str]):
+    # Writes only the given files/directories (by path) to the snapshot
+    global _localsongs_caching, _localsongs_over_limit
+    if not _localsongs_caching or not _localsongs_snapshot or _localsongs_over_limit:
         return None
-    p = Path(_cache_path, _LOCALSONGS_CACHE_FILENAME)
-    path = str(p.absolute())
-    debug(f"CACHE: put local songs: {_LOCALSONGS_CACHE_FILENAME}")
-    # write to disk
-    with p.open("w") as f:
-        json.dump(data, f)
-    # write to memory
-    _available_cache_files.add(path)
+    debug("CACHE: update local songs")
+    try:
+        _localsongs_snapshot.update(files, removed_files, directories, removed_directories)
+        if _localsongs_max_size and _localsongs_snapshot.data_size() > _localsongs_max_size:
+            print(f"WARN: local songs snapshot exceeds the limit of {_localsongs_max_size} bytes, not storing it")
+            _localsongs_snapshot.clear()
+            _localsongs_over_limit = True
+    except sqlite3.Error as e:
+        print(f"WARN: failed to update local songs snapshot: {e}")
 
 def clear_localsongs():
-    p = Path(_cache_path, _LOCALSONGS_CACHE_FILENAME)
-    debug(f"CACHE: remove local songs: {_LOCALSONGS_CACHE_FILENAME}")
-    p.unlink(missing_ok=True)
\ No newline at end of file
+    global _localsongs_over_limit
+    debug("CACHE: remove local songs")
+    if _localsongs_snapshot:
+        _localsongs_snapshot.clear()
+    _localsongs_over_limit = False
@@ -1,46 +1,569 @@
+import mmap
+import multiprocessing
 import os
+import re
+import struct
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Optional, List, Dict, Tuple, Union, Set, FrozenSet
 
 import eyed3
-from PyQt6.QtCore import pyqtSignal
+from PyQt6.QtCore import pyqtSignal, QObject, QFileSystemWatcher, QTimer
 from eyed3.core import AudioFile
 
-from music_dragon import workers
+from music_dragon import cache, workers
 from music_dragon.log import debug
-from music_dragon.utils import crc32
+from music_dragon.utils import crc32, normalize_metadata
 from music_dragon.workers import Worker
 
 MP3_IMAGE_TAG_INDEX_FRONT_COVER = 3
 
+# files sent to each scan process at once
+SCAN_CHUNK_SIZE = 32
+# starting a scan process is not cheap (spawned: imports everything again):
+# worth only if it has at least this many files to read
+SCAN_MIN_FILES_PER_PROCESS = 256
+
+# what the workers notify (e.g. the loaded mp3s) is emitted in batches,
+# every SIGNALS_BATCH_INTERVAL seconds or SIGNALS_BATCH_SIZE items
+SIGNALS_BATCH_INTERVAL = 0.05
+SIGNALS_BATCH_SIZE = 500
+
+# the covers are not kept in memory but read from the files when needed:
+# the most recently used ones are cached
+COVERS_CACHE_MAX_SIZE = 32 * 2 ** 20
+
 mp3s_indexes_by_metadata = {}
+mp3s_indexes_by_path: Dict[str, int] = {}
 mp3s = []
 
-class Mp3:
+# held while the library (mp3s and directories) is changed or read as a
+# whole: the scans, the watcher rescans and the single loads (e.g. of the
+# downloads) can run at the same time.
+# (taken before _unsaved_lock, when both are needed)
+_library_lock = threading.RLock()
+
+# metadata_key(artist, album, song) -> mp3, for the lookups that should not
+# care about case, spacing and typography (see get_by_metadata())
+mp3s_by_metadata_key: Dict[Tuple[str, str, str], 'Mp3'] = {}
+
+# artist -> album -> mp3s, see artists(), albums_of_artist(), tracks_of_album()
+_groups: Dict[Optional[str], Dict[Optional[str], List['Mp3']]] = {}
+# album -> artists, see artists_of_album()
+_albums_artists: Dict[Optional[str], Set[Optional[str]]] = {}
+# (the groups are changed by the scans while the views read them:
+# the accessors return copies)
+_groups_lock = threading.Lock()
+
+# token -> mp3s, trigram -> tokens, see search()
+_search_postings: Dict[str, Set['Mp3']] = {}
+_search_trigrams: Dict[str, Set[str]] = {}
+_search_sorted_tokens: Optional[List[str]] = None # (built when needed)
+_search_index_built = False
+_search_lock = threading.RLock()
+
+# incremented whenever the library changes:
+# what is computed from the library can be kept until it changes
+library_version = 0
+
+# directory -> {"mtime_ns": ..., "dirs": [subdirectories], "files": [mp3 files]}
+# as seen by the last scan: directories whose mtime did not change
+# (no entry added/removed/renamed) are not listed again
+directories: Dict[str, dict] = {}
+
+# what changed since the local songs were last saved (just the changed
+# rows are written to the snapshot), see take_unsaved_changes()
+_unsaved_mp3s: Dict[str, 'Mp3'] = {} # path -> mp3
+_removed_mp3s: Set[str] = set()
+_unsaved_directories: Set[str] = set()
+_removed_directories: Set[str] = set()
+_unsaved_lock = threading.Lock()
+
+# ============ ID3 ===============
+# Minimal reader of the ID3v2/ID3v1 tags: reads only the tag bytes
+# (of the images, only the position and the fingerprint are recorded)
+# and the first audio frame, for the duration.
+# Raises ValueError for what it does not support (e.g. unsynchronisation,
+# compressed frames): eyed3 can be used instead in that case
+# ================================
+
+ID3V1_SIZE = 128
+ID3V2_HEADER = struct.Struct(">3sBBB4s")
+
+# how far to look for the first audio frame after the tag
+MPEG_SYNC_SEARCH_SIZE = 64 * 1024
+
+# enough for the image frame header (mime type, picture type, description)
+ID3_IMAGE_HEADER_MAX_SIZE = 1024
+
+# frame ids (v2.3/v2.4, v2.2)
+ID3_ARTIST_FRAMES = ("TPE1", "TP1")
+ID3_ALBUM_FRAMES = ("TALB", "TAL")
+ID3_TITLE_FRAMES = ("TIT2", "TT2")
+ID3_TRACK_FRAMES = ("TRCK", "TRK")
+# by preference, as eyed3's getBestDate()
+ID3_DATE_FRAMES = ("TDRC", "TYER", "TYE", "TDRL", "TDOR", "TORY", "TOR")
+ID3_IMAGE_FRAMES = ("APIC", "PIC")
+
+# kbps, by [version == MPEG1][layer]
+MPEG_BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+# Hz, by version bits
+MPEG_SAMPLE_RATES = {
+    0b11: [44100, 48000, 32000], # MPEG1
+    0b10: [22050, 24000, 16000], # MPEG2
+    0b00: [11025, 12000, 8000], # MPEG2.5
+}
+
+
+class Id3Tag:
     def __init__(self):
-        # tag
-        self.tag = None
-        self.length = None
         self.artist = None
         self.album = None
-        self.song = None
+        self.title = None
         self.track_num = None
-        self.image = None
-        self.image_path = None # only available if cached
-        self.size = None
         self.year = None
+        self.length = None # ms
+        # position and fingerprint of the front cover data in the file
+        self.image_offset = None
+        self.image_length = None
+        self.image_fingerprint = None
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _decode_id3_text(data: bytes) -> Optional[str]:
+    if not data:
+        return None
+    encoding, data = data[0], data[1:]
+    if encoding == 0:
+        text = data.decode("latin-1")
+    elif encoding == 1:
+        text = data.decode("utf-16")
+    elif encoding == 2:
+        text = data.decode("utf-16-be")
+    elif encoding == 3:
+        text = data.decode("utf-8")
+    else:
+        raise ValueError(f"unknown text encoding {encoding}")
+    # multiple values are null separated: take the first one
+    text = text.split("\0")[0].strip()
+    return text or None
+
+
+def _read_id3_image_header(data: bytes, version: int) -> Tuple[int, int]:
+    # Returns picture type and size of the header of an image frame
+    encoding = data[0]
+    if version == 2:
+        pos = 4 # encoding, image format
+    else:
+        pos = data.index(b"\0", 1) + 1 # encoding, mime type
+    picture_type = data[pos]
+    pos += 1
+    # description
+    if encoding in (1, 2):
+        while data[pos:pos + 2] != b"\0\0":
+            pos += 2
+            if pos >= len(data):
+                raise ValueError("image description too long")
+        pos += 2
+    else:
+        pos = data.index(b"\0", pos) + 1
+    return picture_type, pos
+
+def _read_id3v2_frames(f, version: int, tag_end: int, tag: Id3Tag) -> Dict[str, bytes]:
+    # Returns the payload of the text frames, by frame id;
+    # the position of the front cover is set to the tag
+    frames = {}
+    if version == 2:
+        header_size, id_size = 6, 3
+    else:
+        header_size, id_size = 10, 4
+
+    while f.tell() + header_size <= tag_end:
+        header = f.read(header_size)
+        frame_id = header[:id_size]
+        if not frame_id.strip(b"\0"):
+            break # padding
+        try:
+            frame_id = frame_id.decode("ascii")
+        except UnicodeDecodeError:
+            raise ValueError("invalid frame id")
+
+        if version == 2:
+            size = int.from_bytes(header[3:6], "big")
+            flags = 0
+        elif version == 3:
+            size = int.from_bytes(header[4:8], "big")
+            flags = int.from_bytes(header[8:10], "big")
+            if flags & 0x00C0: # compression, encryption
+                raise ValueError(f"unsupported flags of frame {frame_id}")
+        else:
+            size = _syncsafe(header[4:8])
+            flags = int.from_bytes(header[8:10], "big")
+            if flags & 0x000F: # compression, encryption, unsynchronisation, data length
+                raise ValueError(f"unsupported flags of frame {frame_id}")
+
+        if f.tell() + size > tag_end:
+            raise ValueError(f"frame {frame_id} exceeds the tag")
+
+        if frame_id[0] == "T" and frame_id not in frames:
+            frames[frame_id] = f.read(size)
+        elif frame_id in ID3_IMAGE_FRAMES:
+            start = f.tell()
+            try:
+                picture_type, image_header_size = _read_id3_image_header(
+                    f.read(min(size, ID3_IMAGE_HEADER_MAX_SIZE)), version)
+            except (ValueError, IndexError):
+                raise ValueError("invalid image frame")
+            if picture_type == MP3_IMAGE_TAG_INDEX_FRONT_COVER:
+                tag.image_offset = start + image_header_size
+                tag.image_length = size - image_header_size
+                # computed once here, then persisted with the song
+                tag.image_fingerprint = read_cover_fingerprint(f, tag.image_offset, tag.image_length)
+            f.seek(start + size)
+        else:
+            f.seek(size, os.SEEK_CUR)
+    return frames
+
+
+def _read_mpeg_length(f, start: int, audio_end: int) -> Optional[float]:
+    # Duration (ms) from the first MPEG frame after start:
+    # frames count of the Xing/Info or VBRI header, or bitrate for CBR
+    f.seek(start)
+    data = f.read(MPEG_SYNC_SEARCH_SIZE)
+    pos = 0
+    while True:
+        pos = data.find(b"\xFF", pos)
+        if pos < 0 or pos + 4 > len(data):
+            return None
+        header = int.from_bytes(data[pos:pos + 4], "big")
+        version = (header >> 19) & 0b11
+        layer = 4 - ((header >> 17) & 0b11)
+        bitrate_index = (header >> 12) & 0b1111
+        sample_rate_index = (header >> 10) & 0b11
+        if (header >> 21) & 0x7FF == 0x7FF and version != 0b01 and layer != 4 and \
+                bitrate_index not in (0, 0b1111) and sample_rate_index != 0b11:
+            break
+        pos += 1
+
+    mpeg1 = version == 0b11
+    mono = (header >> 6) & 0b11 == 0b11
+    sample_rate = MPEG_SAMPLE_RATES[version][sample_rate_index]
+    bitrate = MPEG_BITRATES[mpeg1][layer][bitrate_index]
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 2 or mpeg1:
+        samples_per_frame = 1152
+    else:
+        samples_per_frame = 576
+
+    # Xing/Info: after the side information
+    side_info_size = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = pos + 4 + side_info_size
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[xing + 4:xing + 8], "big")
+        if flags & 0x1:
+            frames = int.from_bytes(data[xing + 8:xing + 12], "big")
+            return 1000 * frames * samples_per_frame / sample_rate
+
+    # VBRI: at a fixed offset
+    vbri = pos + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI":
+        frames = int.from_bytes(data[vbri + 14:vbri + 18], "big")
+        return 1000 * frames * samples_per_frame / sample_rate
+
+    # CBR
+    return 8 * (audio_end - (start + pos)) / bitrate
+
+
+def _read_id3v1(f, file_size: int, tag: Id3Tag) -> bool:
+    if file_size < ID3V1_SIZE:
+        return False
+    f.seek(file_size - ID3V1_SIZE)
+    data = f.read(ID3V1_SIZE)
+    if data[:3] != b"TAG":
+        return False
+
+    def text(field: bytes):
+        return field.split(b"\0")[0].decode("latin-1").strip() or None
+
+    tag.title = tag.title or text(data[3:33])
+    tag.artist = tag.artist or text(data[33:63])
+    tag.album = tag.album or text(data[63:93])
+    if tag.year is None:
+        try:
+            tag.year = int(text(data[93:97]) or "")
+        except ValueError:
+            pass
+    if tag.track_num is None and data[125] == 0 and data[126]:
+        tag.track_num = data[126] # ID3v1.1
+    return True
+
+
+def read_id3(path: Union[str, Path]) -> Optional[Id3Tag]:
+    # Returns None if the file has no tag at all
+    with open(path, "rb") as f:
+        file_size = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        tag = Id3Tag()
+        has_tag = False
+        audio_start = 0
+
+        header = f.read(ID3V2_HEADER.size)
+        if len(header) == ID3V2_HEADER.size and header[:3] == b"ID3":
+            _, version, _, flags, size = ID3V2_HEADER.unpack(header)
+            if version not in (2, 3, 4):
+                raise ValueError(f"unsupported ID3v2.{version}")
+            if flags & 0x80:
+                raise ValueError("unsynchronisation not supported")
+            tag_end = ID3V2_HEADER.size + _syncsafe(size)
+            audio_start = tag_end + (10 if version == 4 and flags & 0x10 else 0) # footer
+            if flags & 0x40: # extended header
+                if version == 2:
+                    raise ValueError("compressed tag not supported")
+                extended_size = f.read(4)
+                if version == 3:
+                    f.seek(int.from_bytes(extended_size, "big"), os.SEEK_CUR)
+                else:
+                    f.seek(ID3V2_HEADER.size + _syncsafe(extended_size))
+
+            frames = _read_id3v2_frames(f, version, tag_end, tag)
+            has_tag = True
+
+            def text_frame(ids):
+                for frame_id in ids:
+                    if frame_id in frames:
+                        value = _decode_id3_text(frames[frame_id])
+                        if value:
+                            return value
+                return None
+
+            tag.artist = text_frame(ID3_ARTIST_FRAMES)
+            tag.album = text_frame(ID3_ALBUM_FRAMES)
+            tag.title = text_frame(ID3_TITLE_FRAMES)
+            track = text_frame(ID3_TRACK_FRAMES)
+            if track:
+                try:
+                    tag.track_num = int(track.split("/")[0])
+                except ValueError:
+                    pass
+            date = text_frame(ID3_DATE_FRAMES)
+            if date:
+                try:
+                    tag.year = int(date[:4])
+                except ValueError:
+                    pass
+
+        audio_end = file_size
+        if _read_id3v1(f, file_size, tag):
+            has_tag = True
+            audio_end -= ID3V1_SIZE
+
+        if not has_tag:
+            return None
+
+        tag.length = _read_mpeg_length(f, audio_start, audio_end)
+        if tag.length is None:
+            raise ValueError("no MPEG audio frame found")
+        return tag
+
+
+# ============ STORE ============
+# The attributes of the mp3s are stored by column (arrays of numbers,
+# ids of interned strings, lists) instead of in an object for each mp3:
+# an Mp3 is just a view on its row, so that large libraries
+# take little memory
+# ===============================
+
+_strings: List[str] = [] # interned strings, by id
+_strings_ids: Dict[str, int] = {}
+_store_lock = threading.RLock()
+_rows_count = 0
+_free_rows: List[int] = []
+
+
+def _intern(string: Optional[str]) -> int:
+    if string is None:
+        return -1
+    string_id = _strings_ids.get(string)
+    if string_id is None:
+        with _store_lock:
+            string_id = _strings_ids.get(string)
+            if string_id is None:
+                string_id = len(_strings)
+                _strings.append(sys.intern(str(string)))
+                _strings_ids[_strings[string_id]] = string_id
+    return string_id
+
+
+class _Column:
+    # Attribute of Mp3, stored in a list
+    def __init__(self, default=None):
+        self.default = default
+        self.values = []
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        owner.COLUMNS.append(self)
+
+    def __get__(self, mp3, owner=None):
+        if mp3 is None:
+            return self
+        return self.values[mp3._row]
+
+    def __set__(self, mp3, value):
+        self.values[mp3._row] = value
+
+    def _append(self):
+        self.values.append(self.default)
+
+    def _reset(self, row: int):
+        self.values[row] = self.default
+
+
+class _NumberColumn(_Column):
+    # Attribute of Mp3, stored in an array (None as a sentinel value)
+    def __init__(self, typecode: str, none):
+        super().__init__(none)
+        self.values = array(typecode)
+
+    def __get__(self, mp3, owner=None):
+        if mp3 is None:
+            return self
+        value = self.values[mp3._row]
+        if value == self.default or value != value: # (nan)
+            return None
+        return value
+
+    def __set__(self, mp3, value):
+        self.values[mp3._row] = self.default if value is None else value
+
+
+class _FlagColumn(_Column):
+    def __init__(self):
+        super().__init__(False)
+        self.values = array("b")
+
+    def __get__(self, mp3, owner=None):
+        if mp3 is None:
+            return self
+        return bool(self.values[mp3._row])
+
+    def __set__(self, mp3, value):
+        self.values[mp3._row] = bool(value)
+
+
+class _StringColumn(_Column):
+    # Attribute of Mp3, stored as the id of the interned string
+    def __init__(self):
+        super().__init__(-1)
+        self.values = array("i")
+
+    def __get__(self, mp3, owner=None):
+        if mp3 is None:
+            return self
+        string_id = self.values[mp3._row]
+        return _strings[string_id] if string_id >= 0 else None
+
+    def __set__(self, mp3, value):
+        self.values[mp3._row] = _intern(value)
+
 
-        self.path: Optional[Path] = None
+def _allocate_row() -> int:
+    global _rows_count
+    with _store_lock:
+        if _free_rows:
+            row = _free_rows.pop()
+            for column in Mp3.COLUMNS:
+                column._reset(row)
+            return row
+        for column in Mp3.COLUMNS:
+            column._append()
+        _rows_count += 1
+        return _rows_count - 1
 
-        #
-        self.fetched_release_group = False
-        self.release_group_id = None
 
-        self.fetched_artist = False
-        self.artist_id = None
+def _release_row(row: int):
+    with _store_lock:
+        for column in Mp3.COLUMNS:
+            column._reset(row)
+        _free_rows.append(row)
 
-        self.fetched_track = False
-        self.track_id = None
+
+class Mp3:
+    __slots__ = ("_row", )
+
+    length = _NumberColumn("d", float("nan")) # ms
+    artist = _StringColumn()
+    album = _StringColumn()
+    song = _Column()
+    track_num = _NumberColumn("q", -1)
+    year = _NumberColumn("q", -1)
+    image_fingerprint = _StringColumn() # key of the cover in the covers table
+    image_offset = _NumberColumn("q", -1) # position of the cover in the file, if known
+    image_length = _NumberColumn("q", -1)
+    size = _NumberColumn("q", -1)
+    mtime_ns = _NumberColumn("q", -2 ** 63)
+    inode = _NumberColumn("Q", 2 ** 64 - 1)
+
+    # path, as directory and file name
+    directory = _StringColumn()
+    file_name = _Column()
+
+    #
+    fetched_release_group = _FlagColumn()
+    release_group_id = _StringColumn()
+
+    fetched_artist = _FlagColumn()
+    artist_id = _StringColumn()
+
+    fetched_track = _FlagColumn()
+    track_id = _StringColumn()
+
+    COLUMNS: List[_Column] = []
+
+    def __init__(self):
+        self._row = _allocate_row()
+
+    def __del__(self):
+        if _release_row: # (not at interpreter exit)
+            _release_row(self._row)
+
+    @property
+    def path(self) -> Optional[Path]:
+        if self.file_name is None:
+            return None
+        return Path(self.directory, self.file_name)
+
+    @path.setter
+    def path(self, path: Union[str, Path, None]):
+        if path is None:
+            self.directory = self.file_name = None
+        else:
+            directory, self.file_name = os.path.split(str(path))
+            self.directory = directory
 
     def title(self):
         if self.song:
@@ -48,6 +571,23 @@ class Mp3:
         print(f"WARN: no song attribute for mp3 {self.path}")
         return self.path.stem
 
+    @property
+    def image(self) -> Optional[bytes]:
+        if self.image_fingerprint is None:
+            return None
+        image = covers.get(self.image_fingerprint)
+        if image is None and self.image_offset is not None:
+            image = read_cover(self.path, self.image_offset, self.image_length, self.image_fingerprint)
+        return image
+
+    @image.setter
+    def image(self, image: Optional[bytes]):
+        self.image_fingerprint = put_cover(image) if image else None
+
+    def has_image(self):
+        # without actually reading it
+        return self.image_fingerprint is not None
+
     def load_from_file(self, file: str, load_image=True):
         p = Path(file)
 
@@ -59,18 +599,53 @@ class Mp3:
             return False
 
         self.path = p.absolute()
-        self.tag = None
 
         try:
-            self.size = os.stat(self.path).st_size
+            stat = os.stat(self.path)
+            self.size = stat.st_size
+            self.mtime_ns = stat.st_mtime_ns
+            self.inode = stat.st_ino
+
+            try:
+                tag = read_id3(self.path)
+            except ValueError as e:
+                debug(f"Cannot read tag of '{file}' ({e}), using eyed3")
+                return self._load_from_file_with_eyed3(file, load_image)
+
+            if not tag:
+                print(f"WARN: no mp3 tag found for file '{file}', skipping")
+                return False
+            self.length = tag.length
+            self.artist = tag.artist
+            self.album = tag.album
+            self.song = tag.title
+            self.track_num = tag.track_num
+            self.year = tag.year
+            self.image_offset = tag.image_offset
+            self.image_length = tag.image_length
+            self.image_fingerprint = tag.image_fingerprint
+
+            debug(f"Loaded {self.path}: "
+                  f"(artist={self.artist}, "
+                  f"album={self.album}, "
+                  f"title={self.song}, "
+                  f"year={self.year}, "
+                  f"track_num={self.track_num}, "
+                  f"image={'yes' if self.has_image() else 'no'})")
+            return True
+        except Exception as e:
+            print(f"WARN: failed to load mp3 from '{file}': {e}")
+
+        return False
 
+    def _load_from_file_with_eyed3(self, file: str, load_image=True):
+        try:
             mp3: AudioFile = eyed3.load(self.path)
             if mp3:
                 if not mp3.tag:
                     print(f"WARN: no mp3 tag found for file '{file}', skipping")
                     return False
                 self.length = 1000 * mp3.info.time_secs
-                self.tag = mp3.tag
                 self.artist = mp3.tag.artist
                 self.album = mp3.tag.album
                 self.song = mp3.tag.title
@@ -81,7 +656,7 @@ class Mp3:
                     pass
 
                 if load_image:
-                    self._load_image_from_tag()
+                    self._load_image_from_tag(mp3.tag)
 
                 debug(f"Loaded {self.path}: "
                       f"(artist={self.artist}, "
@@ -89,7 +664,7 @@ class Mp3:
                       f"title={self.song}, "
                       f"year={self.year}, "
                       f"track_num={self.track_num}, "
-                      f"image={'yes' if self.image else 'no'})")
+                      f"image={'yes' if self.has_image() else 'no'})")
                 return True
         except Exception as e:
             print(f"WARN: failed to load mp3 from '{file}': {e}")
@@ -98,19 +673,30 @@ class Mp3:
 
     def load_from_info(self, info: dict, load_image=True):
         self.size = info.get("size")
-        self.path = Path(info.get("path"))
+        self.mtime_ns = info.get("mtime_ns")
+        self.inode = info.get("inode")
+        self.path = info.get("path")
         self.length = info.get("length")
         self.artist = info.get("artist")
         self.album = info.get("album")
         self.song = info.get("song")
         self.track_num = info.get("track_num")
         self.year = info.get("year")
-        self.image_path = info.get("image")
-        self.tag = None
+        self.image_offset = info.get("image_offset")
+        self.image_length = info.get("image_length")
+        self.image_fingerprint = info.get("image_fingerprint")
+
+        if self.image_offset is not None and self.image_fingerprint is None:
+            # cached before the fingerprint was computed by the scan
+            try:
+                with open(self.path, "rb") as f:
+                    self.image_fingerprint = read_cover_fingerprint(f, self.image_offset, self.image_length)
+            except (OSError, ValueError) as e:
+                print(f"WARN: failed to read cover of '{self.path}': {e}")
 
-        if load_image:
-            if self.image_path:
-                self._load_image_from_path(self.image_path)
+        if load_image and self.image_offset is None:
+            if self.image_fingerprint and self.image_fingerprint not in covers:
+                self._load_image_from_cache()
 
                 debug(f"Loaded [cached] {self.path}: "
                       f"(artist={self.artist}, "
@@ -118,44 +704,63 @@ class Mp3:
                       f"title={self.song}, "
                       f"year={self.year}, "
                       f"track_num={self.track_num}, "
-                      f"image={'yes' if self.image else 'no'})")
+                      f"image={'yes' if self.has_image() else 'no'})")
 
         return True
 
+    def info(self) -> dict:
+        # the (picklable) info load_from_info() can restore the mp3 from
+        return {
+            "path": str(self.path),
+            "length": self.length,
+            "artist": self.artist,
+            "album": self.album,
+            "song": self.song,
+            "track_num": self.track_num,
+            "year": self.year,
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "inode": self.inode,
+            "image_offset": self.image_offset,
+            "image_length": self.image_length,
+            "image_fingerprint": self.image_fingerprint,
+        }
+
 
     def load_image(self):
-        if self.image:
-            return
+        if self.image_offset is not None or self.image_fingerprint in covers:
+            return # read when needed, or already loaded (maybe by another song)
 
-        if self.image_path is not None:
-            self._load_image_from_path(self.image_path)
-        else:
+        if self.image_fingerprint is not None:
+            self._load_image_from_cache()
+        if self.image_fingerprint not in covers:
             self._load_image_from_tag()
 
 
-    def _load_image_from_tag(self):
-        # Eventually load tag
-        if not self.tag:
+    def _load_image_from_tag(self, tag=None):
+        # Eventually load tag (not kept, since it holds all the frames)
+        if not tag:
             try:
                 mp3: AudioFile = eyed3.load(self.path)
                 if mp3:
-                    self.tag = mp3.tag
+                    tag = mp3.tag
             except Exception as e:
                 print(f"WARN: failed to load mp3 from '{self.path}': {e}")
 
-        if not self.tag:
+        if not tag:
             print(f"WARN: no tag for mp3 {self.path}")
             return
 
-        for img in self.tag.images:
+        for img in tag.images:
             if img.picture_type == MP3_IMAGE_TAG_INDEX_FRONT_COVER:
                 self.image = img.image_data
                 debug(f"Loaded image of {self}")
 
 
-    def _load_image_from_path(self, image_path):
-        with Path(image_path).open("rb") as img:
-            self.image = img.read()
+    def _load_image_from_cache(self):
+        image = cache.get_image(self.image_fingerprint)
+        if image:
+            put_cover(image, self.image_fingerprint)
             debug(f"Loaded [cached] image of {self}")
 
 
@@ -163,113 +768,858 @@ class Mp3:
         return f"{self.artist} - {self.album} - {self.song}"
 
 
-def get_by_metadata(artist: str, album: str, song: str) -> Optional[Mp3]:
-    idx = mp3s_indexes_by_metadata.get((artist, album, song))
-    debug(f"Checking availability of ({artist}, {album}, {song})")
-    if idx is not None and 0 <= idx < len(mp3s):
-        debug("-> found")
-        return mp3s[idx]
+# ============ COVERS ============
+# Covers are content addressed by their fingerprint: the songs of an album
+# (usually embedding the same cover) share a single copy.
+# Covers that can't be read back from the file (e.g. loaded with eyed3)
+# are kept in 'covers'; the ones whose position in the file is known are
+# read when needed and only the most recently used are kept in '_covers'
+# ================================
+
+covers: Dict[str, bytes] = {} # fingerprint -> image
+
+_covers = OrderedDict() # fingerprint -> image
+_covers_size = 0
+_covers_lock = threading.Lock()
+
+# the cover is read (and hashed) a chunk at a time by the scan
+COVER_FINGERPRINT_CHUNK_SIZE = 64 * 1024
+
+def cover_fingerprint(image: bytes) -> str:
+    return f"{crc32(image)}-{len(image)}"
+
+def read_cover_fingerprint(f, offset: int, length: int) -> str:
+    # Same as cover_fingerprint() of the image at the given position
+    # of the file, without holding the whole image in memory
+    f.seek(offset)
+    value = 0
+    remaining = length
+    while remaining > 0:
+        chunk = f.read(min(remaining, COVER_FINGERPRINT_CHUNK_SIZE))
+        if not chunk:
+            raise ValueError("image exceeds the file")
+        value = crc32(chunk, value)
+        remaining -= len(chunk)
+    return f"{value}-{length}"
+
+def put_cover(image: bytes, fingerprint: str = None) -> str:
+    # Adds the cover to the covers table (if not there yet),
+    # returns its fingerprint
+    if fingerprint is None:
+        fingerprint = cover_fingerprint(image)
+    covers.setdefault(fingerprint, image)
+    return fingerprint
+
+def _read_cover_from_file(path: Path, offset: int, length: int) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            start = offset - offset % mmap.ALLOCATIONGRANULARITY
+            with mmap.mmap(f.fileno(), offset - start + length, offset=start, access=mmap.ACCESS_READ) as m:
+                return m[offset - start:]
+    except (OSError, ValueError) as e:
+        print(f"WARN: failed to read cover of '{path}': {e}")
+    return None
+
+def read_cover(path: Path, offset: int, length: int, fingerprint: str) -> Optional[bytes]:
+    # Reads (mapping just that region of the file) the cover at the given
+    # position, or returns it from the cache of the most recently used ones
+    global _covers_size
+    with _covers_lock:
+        image = _covers.get(fingerprint)
+        if image is not None:
+            _covers.move_to_end(fingerprint)
+            return image
+
+    image = _read_cover_from_file(path, offset, length)
+    if image is None:
+        return None
+
+    with _covers_lock:
+        if fingerprint not in _covers:
+            _covers[fingerprint] = image
+            _covers_size += len(image)
+        while _covers_size > COVERS_CACHE_MAX_SIZE and len(_covers) > 1:
+            _, evicted = _covers.popitem(last=False)
+            _covers_size -= len(evicted)
+    return image
+
+# ============ METADATA KEYS ===============
+# Normalized (artist, album, song) used to match the local songs
+# with the MusicBrainz metadata: case, spacing, typographic quotes/dashes
+# and the way multiple artists are joined don't matter
+# ==========================================
+
+_ARTISTS_SEPARATORS = re.compile(r"\s*(?:,|;|&|/|\band\b|\bfeat\b\.?|\bft\b\.?)\s*")
+
+def _normalize_metadata_field(field: Optional[str]) -> str:
+    if not field:
+        return ""
+    if field.isascii():
+        field = field.lower() # (nothing else to normalize)
     else:
-        debug("-> not found")
+        field = unicodedata.normalize("NFKC", normalize_metadata(field)).casefold()
+    return " ".join(field.split())
+
+def metadata_key(artist: Optional[str], album: Optional[str], song: Optional[str]) -> Tuple[str, str, str]:
+    artist = _ARTISTS_SEPARATORS.sub(", ", _normalize_metadata_field(artist))
+    return artist, _normalize_metadata_field(album), _normalize_metadata_field(song)
+
+def _mp3_metadata_key(mp3: 'Mp3'):
+    return metadata_key(mp3.artist, mp3.album, mp3.title())
+
+def get_by_metadata(artist: str, album: str, song: str) -> Optional[Mp3]:
+    return mp3s_by_metadata_key.get(metadata_key(artist, album, song))
+
+def find_by_metadata(artists: List[str], album: str, songs: List[str]) -> Optional[Mp3]:
+    # The first mp3 matching any of the artists (e.g. with aliases)
+    # and any of the songs (e.g. with aliases)
+    for artist in artists:
+        for song in songs:
+            mp3 = get_by_metadata(artist, album, song)
+            if mp3:
+                return mp3
     return None
 
 
+# ============ GROUPS ===============
+# The mp3s grouped by artist and album (the ones without artist/album
+# are grouped under None), kept up to date as the mp3s are added
+# and removed: the albums of an artist and the tracks of an album
+# are found without going through the whole library
+# ===================================
+
+def _group_key(mp3: 'Mp3'):
+    return mp3.artist or None, mp3.album or None
+
+def _add_to_groups(mp3: 'Mp3'):
+    artist, album = _group_key(mp3)
+    with _groups_lock:
+        _groups.setdefault(artist, {}).setdefault(album, []).append(mp3)
+        _albums_artists.setdefault(album, set()).add(artist)
+
+def _remove_from_groups(mp3: 'Mp3'):
+    artist, album = _group_key(mp3)
+    with _groups_lock:
+        albums = _groups.get(artist)
+        tracks = albums.get(album) if albums else None
+        if not tracks:
+            return
+        for i, track in enumerate(tracks):
+            if track is mp3:
+                del tracks[i]
+                break
+        if not tracks:
+            del albums[album]
+            if not albums:
+                del _groups[artist]
+            _albums_artists[album].discard(artist)
+            if not _albums_artists[album]:
+                del _albums_artists[album]
+
+def _clear_groups():
+    with _groups_lock:
+        _groups.clear()
+        _albums_artists.clear()
+
+def artists() -> List[Optional[str]]:
+    with _groups_lock:
+        return list(_groups)
+
+def albums_of_artist(artist: Optional[str]) -> List[Optional[str]]:
+    with _groups_lock:
+        return list(_groups.get(artist or None, {}))
+
+def tracks_of_album(artist: Optional[str], album: Optional[str]) -> List['Mp3']:
+    with _groups_lock:
+        return list(_groups.get(artist or None, {}).get(album or None, []))
+
+def artists_of_album(album: Optional[str]) -> List[Optional[str]]:
+    # (albums with the same title by different artists)
+    with _groups_lock:
+        return list(_albums_artists.get(album or None, ()))
+
+def tracks_of_artist(artist: Optional[str]) -> List['Mp3']:
+    with _groups_lock:
+        return [mp3 for tracks in _groups.get(artist or None, {}).values() for mp3 in tracks]
+
+def albums() -> List[Tuple[Optional[str], Optional[str], List['Mp3']]]:
+    # (artist, album, mp3s) of every album
+    with _groups_lock:
+        return [(artist, album, list(tracks))
+                for artist, artist_albums in _groups.items() for album, tracks in artist_albums.items()]
+
+
+# ============ SEARCH ===============
+# Index of the words (tokens) of the song, artist and album of the mp3s,
+# for filtering the library: a word of the filter matches the tokens
+# that contain it (found through the trigrams of the tokens, or by prefix
+# for the shorter words) or, if none does, the ones within one edit.
+# The index is built on the first search and then kept up to date
+# as the mp3s are added and removed
+# ===================================
+
+_TOKENS = re.compile(r"\w+")
+
+def _tokens(text: Optional[str]) -> FrozenSet[str]:
+    return frozenset(_TOKENS.findall(_normalize_metadata_field(text)))
+
+@lru_cache(maxsize=4096) # (artists and albums are shared by many mp3s)
+def _cached_tokens(text: Optional[str]) -> FrozenSet[str]:
+    return _tokens(text)
+
+def _mp3_tokens(mp3: 'Mp3') -> FrozenSet[str]:
+    return _tokens(mp3.title()) | _cached_tokens(mp3.artist) | _cached_tokens(mp3.album)
+
+def _trigrams(token: str) -> Set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+def _add_to_search_index(mp3: 'Mp3'):
+    global _search_sorted_tokens
+    with _search_lock:
+        if not _search_index_built:
+            return
+        for token in _mp3_tokens(mp3):
+            postings = _search_postings.get(token)
+            if postings is None:
+                _search_postings[token] = postings = set()
+                for trigram in _trigrams(token):
+                    tokens = _search_trigrams.get(trigram)
+                    if tokens is None:
+                        _search_trigrams[trigram] = tokens = set()
+                    tokens.add(token)
+                _search_sorted_tokens = None
+            postings.add(mp3)
+
+def _remove_from_search_index(mp3: 'Mp3'):
+    global _search_sorted_tokens
+    with _search_lock:
+        if not _search_index_built:
+            return
+        for token in _mp3_tokens(mp3):
+            postings = _search_postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(mp3)
+            if not postings:
+                del _search_postings[token]
+                for trigram in _trigrams(token):
+                    tokens = _search_trigrams.get(trigram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del _search_trigrams[trigram]
+                _search_sorted_tokens = None
+
+def _clear_search_index():
+    global _search_index_built, _search_sorted_tokens
+    with _search_lock:
+        _search_postings.clear()
+        _search_trigrams.clear()
+        _search_sorted_tokens = None
+        _search_index_built = False
+
+def _build_search_index():
+    global _search_index_built
+    with _search_lock:
+        if _search_index_built:
+            return
+        debug(f"Building search index of {len(mp3s)} mp3s")
+        _search_index_built = True
+        for mp3 in list(mp3s):
+            _add_to_search_index(mp3)
+
+def _within_one_edit(a: str, b: str):
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or \
+               a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:] # substitution or transposition
+    return a[i:] == b[i + 1:] # insertion
+
+def _matching_tokens(word: str) -> List[str]:
+    global _search_sorted_tokens
+    if len(word) < 3:
+        # prefix
+        if _search_sorted_tokens is None:
+            _search_sorted_tokens = sorted(_search_postings)
+        start = bisect_left(_search_sorted_tokens, word)
+        end = bisect_left(_search_sorted_tokens, word + "\U0010ffff")
+        return _search_sorted_tokens[start:end]
+
+    # substring
+    trigrams = sorted((_search_trigrams.get(trigram, set()) for trigram in _trigrams(word)), key=len)
+    tokens = [token for token in set.intersection(*trigrams) if word in token] if trigrams[0] else []
+    if tokens or len(word) < 4:
+        return tokens
+
+    # fuzzy: one edit changes at most 3 trigrams, of the word or of its prefix
+    counts: Dict[str, int] = {}
+    for candidates in trigrams:
+        for token in candidates:
+            counts[token] = counts.get(token, 0) + 1
+    return [token for token, count in counts.items()
+            if count >= len(trigrams) - 3 and
+            (_within_one_edit(word, token) or _within_one_edit(word, token[:len(word)]))]
+
+def search(text: str) -> Optional[Set['Mp3']]:
+    # The mp3s matching every word of text (in the song, artist or album),
+    # or None if there is nothing to search
+    words = _tokens(text)
+    if not words:
+        return None
+    _build_search_index()
+    with _search_lock:
+        result = None
+        for word in sorted(words, key=len, reverse=True): # (longer words match less)
+            matches = set()
+            for token in _matching_tokens(word):
+                matches.update(_search_postings[token])
+            result = matches if result is None else result & matches
+            if not result:
+                break
+        return result
+
+
+class ScanDelta:
+    # What a scan changed in the library
+    def __init__(self):
+        self.added: List[Mp3] = []
+        self.removed: List[Mp3] = []
+        self.changed: List[Mp3] = [] # the new mp3s, replacing the ones with the same path
+        self.replaced: List[Mp3] = [] # the mp3s replaced by the changed ones
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def __str__(self):
+        return f"{len(self.added)} added, {len(self.removed)} removed, {len(self.changed)} changed"
+
+
+def _add_mp3(mp3: Mp3):
+    global library_version
+    mp3s_indexes_by_metadata[(mp3.artist, mp3.album, mp3.title())] = len(mp3s)
+    mp3s_indexes_by_path[str(mp3.path)] = len(mp3s)
+    mp3s_by_metadata_key.setdefault(_mp3_metadata_key(mp3), mp3)
+    _add_to_groups(mp3)
+    mp3s.append(mp3)
+    _add_to_search_index(mp3) # (after the mp3 is in mp3s, in case the index is being built)
+    library_version += 1
+
+def _replace_mp3(idx: int, mp3: Mp3):
+    global library_version
+    old = mp3s[idx]
+    key = (old.artist, old.album, old.title())
+    if mp3s_indexes_by_metadata.get(key) == idx:
+        del mp3s_indexes_by_metadata[key]
+    key = _mp3_metadata_key(old)
+    if mp3s_by_metadata_key.get(key) is old:
+        del mp3s_by_metadata_key[key]
+    _remove_from_groups(old)
+    mp3s[idx] = mp3
+    mp3s_indexes_by_metadata[(mp3.artist, mp3.album, mp3.title())] = idx
+    mp3s_indexes_by_path[str(mp3.path)] = idx
+    _add_to_groups(mp3)
+    _remove_from_search_index(old)
+    _add_to_search_index(mp3)
+    mp3s_by_metadata_key[_mp3_metadata_key(mp3)] = mp3
+    library_version += 1
+
+def _remove_mp3s(removed: List[Mp3]):
+    global library_version
+    removed_ids = set(id(mp3) for mp3 in removed)
+    for mp3 in removed:
+        _remove_from_groups(mp3)
+    mp3s[:] = [mp3 for mp3 in mp3s if id(mp3) not in removed_ids]
+    for mp3 in removed:
+        _remove_from_search_index(mp3)
+    mp3s_indexes_by_metadata.clear()
+    mp3s_indexes_by_path.clear()
+    mp3s_by_metadata_key.clear()
+    for idx, mp3 in enumerate(mp3s):
+        mp3s_indexes_by_metadata[(mp3.artist, mp3.album, mp3.title())] = idx
+        mp3s_indexes_by_path[str(mp3.path)] = idx
+        mp3s_by_metadata_key.setdefault(_mp3_metadata_key(mp3), mp3)
+    library_version += 1
+
+def index_of(mp3: Mp3) -> Optional[int]:
+    # The position of the mp3 in mp3s, if it's (still) in the library
+    with _library_lock:
+        idx = mp3s_indexes_by_path.get(str(mp3.path))
+        return idx if idx is not None and mp3s[idx] is mp3 else None
+
 def load_mp3(file: str, load_image=True):
+    # (if the file is already in the library, e.g. because a rescan
+    # found it first, its mp3 is replaced)
     mp3: Mp3 = Mp3()
     if mp3.load_from_file(file, load_image=load_image):
-        mp3s_indexes_by_metadata[(mp3.artist, mp3.album, mp3.title())] = len(mp3s)
-        mp3s.append(mp3)
+        with _library_lock:
+            idx = mp3s_indexes_by_path.get(str(mp3.path))
+            if idx is None:
+                _add_mp3(mp3)
+            else:
+                _replace_mp3(idx, mp3)
+            _mark_unsaved(mp3)
         return mp3
     return None
 
 def load_mp3_from_info(mp3_info: dict, load_image=True):
     mp3: Mp3 = Mp3()
     if mp3.load_from_info(mp3_info, load_image=load_image):
-        mp3s_indexes_by_metadata[(mp3.artist, mp3.album, mp3.title())] = len(mp3s)
-        mp3s.append(mp3)
+        with _library_lock:
+            _add_mp3(mp3)
         return mp3
     return None
 
-def load_mp3s(directory: str, info=None, load_images=True, mp3_loaded_callback=None):
+def _read_mp3_info(file: str, load_image: bool) -> Optional[dict]:
+    # Executed by the scan processes: reads the tag of the file
+    # and sends back only plain data
+    mp3: Mp3 = Mp3()
+    if not mp3.load_from_file(file, load_image=load_image):
+        return None
+    mp3_info = mp3.info()
+    # only if not read lazily from the file
+    mp3_info["image"] = mp3.image if mp3.image_offset is None else None
+    return mp3_info
+
+def _read_mp3s_infos(files: List[str], load_images: bool, processes: int):
+    # Yields the info of each file (or None if it can't be loaded),
+    # in the same order of the given files
+    processes = min(processes, len(files) // SCAN_MIN_FILES_PER_PROCESS)
+    if processes <= 1:
+        for file in files:
+            yield _read_mp3_info(file, load_images)
+        return
+
+    debug(f"Reading {len(files)} mp3 files with {processes} processes")
+    # (spawned, not forked: a fork from this thread while the others hold
+    # locks, e.g. the store one, would leave the child stuck on them)
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        yield from executor.map(_read_mp3_info, files, [load_images] * len(files),
+                                chunksize=SCAN_CHUNK_SIZE)
+
+def _is_unchanged(mp3_info: dict, stat: os.stat_result):
+    # (entries of old caches have only the size)
+    return mp3_info.get("size") == stat.st_size and \
+        mp3_info.get("mtime_ns", stat.st_mtime_ns) == stat.st_mtime_ns and \
+        mp3_info.get("inode", stat.st_ino) == stat.st_ino
+
+def _scan_directory(root: str, known_files: Dict[str, dict], known_directories: Dict[str, dict],
+                    stat_all_files=True):
+    # Returns the mp3 files under root, as (path, known info if the file
+    # is unchanged, otherwise None), the listing of the directories and
+    # the known listing of the directories listed again (None if not known).
+    # Directories not changed since the known listing are not listed
+    # again; their files are stat-ed anyway (a file rewritten in place
+    # doesn't change the directory) unless stat_all_files is False
+    files: List[Tuple[str, Optional[dict]]] = []
+    scanned_directories: Dict[str, dict] = {}
+    relisted_directories: Dict[str, Optional[dict]] = {}
+
+    def validated(f: str, mp3_info: Optional[dict]):
+        try:
+            if mp3_info and not _is_unchanged(mp3_info, os.stat(f)):
+                return None
+        except OSError:
+            return None
+        return mp3_info
+
+    def scan(directory: str):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError as e:
+            print(f"WARN: cannot scan directory '{directory}': {e}")
+            return
+
+        known = known_directories.get(directory)
+        if known and known["mtime_ns"] == mtime_ns:
+            known_infos = [known_files.get(f) for f in known["files"]]
+            if all(mp3_info is not None for mp3_info in known_infos):
+                scanned_directories[directory] = known
+                for subdirectory in known["dirs"]:
+                    scan(subdirectory)
+                if stat_all_files:
+                    known_infos = [validated(f, mp3_info) for f, mp3_info in zip(known["files"], known_infos)]
+                files.extend(zip(known["files"], known_infos))
+                return
+
+        listing = {"mtime_ns": mtime_ns, "dirs": [], "files": []}
+        scanned_directories[directory] = listing
+        relisted_directories[directory] = known
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError as e:
+            print(f"WARN: cannot scan directory '{directory}': {e}")
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                listing["dirs"].append(entry.path)
+            elif entry.name.endswith(".mp3"):
+                listing["files"].append(entry.path)
+
+        # (children first, as os.walk(topdown=False) did)
+        for subdirectory in listing["dirs"]:
+            scan(subdirectory)
+        for f in listing["files"]:
+            files.append((f, validated(f, known_files.get(f))))
+
+    scan(root)
+    return files, scanned_directories, relisted_directories
+
+def _mark_relisted_directories(scanned_directories: Dict[str, dict],
+                               relisted_directories: Dict[str, Optional[dict]],
+                               known_directories: Dict[str, dict]):
+    # Records the directories listed again as unsaved, and what's not
+    # there anymore (according to their known listing) as removed
+    removed_directories = []
+    removed_files = []
+    for directory, known in relisted_directories.items():
+        if known:
+            removed_directories += [d for d in known["dirs"] if d not in scanned_directories]
+            listing = set(scanned_directories[directory]["files"])
+            removed_files += [f for f in known["files"] if f not in listing]
+    # (whatever was below a removed directory is gone too)
+    i = 0
+    while i < len(removed_directories):
+        known = known_directories.get(removed_directories[i])
+        if known:
+            removed_directories += known["dirs"]
+            removed_files += known["files"]
+        i += 1
+
+    with _unsaved_lock:
+        _unsaved_directories.update(relisted_directories)
+        _removed_directories.difference_update(relisted_directories)
+        _unsaved_directories.difference_update(removed_directories)
+        _removed_directories.update(removed_directories)
+    _mark_removed(removed_files)
+
+def _mark_unsaved(mp3: 'Mp3'):
+    with _unsaved_lock:
+        path = str(mp3.path)
+        _unsaved_mp3s[path] = mp3
+        _removed_mp3s.discard(path)
+
+def _mark_removed(paths: List[str]):
+    with _unsaved_lock:
+        for path in paths:
+            _unsaved_mp3s.pop(path, None)
+        _removed_mp3s.update(paths)
+
+def mark_all_unsaved():
+    # E.g. after the snapshot has been cleared: the whole library
+    # (as it is in memory) is written by the next save
+    with _library_lock:
+        unsaved_mp3s = {str(mp3.path): mp3 for mp3 in mp3s}
+        unsaved_directories = set(directories)
+    with _unsaved_lock:
+        _unsaved_mp3s.update(unsaved_mp3s)
+        _removed_mp3s.difference_update(unsaved_mp3s)
+        _unsaved_directories.update(unsaved_directories)
+        _removed_directories.difference_update(unsaved_directories)
+
+def take_unsaved_changes() -> Tuple[List[dict], List[str], Dict[str, dict], List[str]]:
+    # Returns (and forgets) what changed since the last call: info of the
+    # changed mp3s, paths of the removed ones, listings of the changed
+    # directories, paths of the removed ones
+    with _library_lock, _unsaved_lock:
+        files = [mp3.info() for mp3 in _unsaved_mp3s.values()]
+        removed_files = list(_removed_mp3s)
+        changed_directories = {d: directories[d] for d in _unsaved_directories if d in directories}
+        removed_directories = list(_removed_directories)
+        _unsaved_mp3s.clear()
+        _removed_mp3s.clear()
+        _unsaved_directories.clear()
+        _removed_directories.clear()
+    return files, removed_files, changed_directories, removed_directories
+
+def load_mp3s(directory: str, info=None, load_images=True, mp3_loaded_callback=None, processes=1,
+              progress_callback=None, stat_all_files=True) -> Optional[ScanDelta]:
+    # If the library is empty, info (the local songs cache) is used to
+    # figure out which files are already known; otherwise the library
+    # is rescanned, and only added/changed/removed files are touched.
+    # progress_callback(done, total) is called for each scanned file.
+    # Without stat_all_files (e.g. to validate the library loaded from
+    # the cache at startup, quickly) the files of the directories not
+    # changed are not stat-ed: the ones rewritten in place are not seen
     root = Path(directory)
     if not root.exists():
         print(f"WARN: cannot load mp3s from directory '{directory}': does not exist")
-        return
+        return None
     if not root.is_dir():
         print(f"WARN: cannot load mp3s from directory '{directory}': not a directory")
-        return
-
-    file_count = 0
-    loaded_file_count = 0
-    for root, dirs, files in os.walk(str(root.absolute()), topdown=False):
-        for file in files:
-            if not file.endswith(".mp3"):
-                continue # skip non mp3
-            file_count += 1
-
-            full_path = os.path.join(root, file)
-
-            mp3 = None
-
-            # check whether we already know this file
-            if info and full_path in info:
-                mp3_info =  info[full_path]
-                stat = os.stat(full_path)
-                # TODO: md5, crc32 would be more reliable
-                if mp3_info.get("size", 0) == stat.st_size:
-                    mp3 = load_mp3_from_info(mp3_info)
-
-            if not mp3:
-                mp3 = load_mp3(full_path, load_image=load_images)
-
-            if mp3:
-                loaded_file_count += 1
-                if callable(mp3_loaded_callback):
-                    mp3_loaded_callback(mp3)
-
-    debug(f"Loaded {loaded_file_count}/{file_count} mp3 files")
+        return None
+
+    with _library_lock:
+        known_files = {str(mp3.path): mp3.info() for mp3 in mp3s}
+        known_directories = dict(directories)
+    current_mp3s = set(known_files)
+    if not current_mp3s:
+        if info and "files" in info:
+            known_files = info["files"]
+            known_directories = info.get("directories", {})
+        else:
+            known_files = info or {} # old cache format: just the files
+            known_directories = {}
+
+    files, scanned_directories, relisted_directories = \
+        _scan_directory(str(root.absolute()), known_files, known_directories, stat_all_files)
+    with _library_lock:
+        _mark_relisted_directories(scanned_directories, relisted_directories, known_directories)
+        directories.clear()
+        directories.update(scanned_directories)
+
+    delta = _load_scanned_files(files, current_mp3s, load_images, processes, mp3_loaded_callback, progress_callback)
+    debug(f"Scanned {len(files)} mp3 files: {delta}")
+    return delta
+
+def rescan_directories(dirs: List[str], load_images=True, mp3_loaded_callback=None) -> ScanDelta:
+    # Rescans only the given directories (and what is below them), e.g.
+    # because they have been reported as changed by the filesystem
+    delta = ScanDelta()
+    for directory in dirs:
+        prefix = directory.rstrip(os.sep) + os.sep
+        with _library_lock:
+            known_files = {str(mp3.path): mp3.info() for mp3 in mp3s if str(mp3.path).startswith(prefix)}
+            # the directory itself has to be listed again for sure
+            known_directories = {d: listing for d, listing in directories.items() if d != directory}
+        current_mp3s = set(known_files)
+
+        files = []
+        scanned_directories = {}
+        relisted_directories = {}
+        if os.path.isdir(directory):
+            files, scanned_directories, relisted_directories = \
+                _scan_directory(directory, known_files, known_directories)
+        with _library_lock:
+            # (compared with the listings of the library, the directory included)
+            relisted_directories = {d: directories.get(d) for d in relisted_directories}
+            _mark_relisted_directories(scanned_directories, relisted_directories, directories)
+            removed = [d for d in directories if (d == directory or d.startswith(prefix)) and d not in scanned_directories]
+            with _unsaved_lock:
+                _unsaved_directories.difference_update(removed)
+                _removed_directories.update(removed)
+            for d in [d for d in directories if d == directory or d.startswith(prefix)]:
+                del directories[d]
+            directories.update(scanned_directories)
+
+        directory_delta = _load_scanned_files(files, current_mp3s, load_images, 1, mp3_loaded_callback)
+        debug(f"Rescanned '{directory}': {directory_delta}")
+        delta.added += directory_delta.added
+        delta.removed += directory_delta.removed
+        delta.changed += directory_delta.changed
+        delta.replaced += directory_delta.replaced
+    return delta
+
+def _load_scanned_files(files: List[Tuple[str, Optional[dict]]], current_mp3s: Set[str],
+                        load_images: bool, processes: int, mp3_loaded_callback, progress_callback=None) -> ScanDelta:
+    # Brings the library up to date with the scanned files: current_mp3s
+    # are the paths of the mp3s of the library the scan covered.
+    # The mp3s are looked up by path when they are changed, since
+    # the library may have been changed meanwhile (e.g. by load_mp3())
+
+    # the files not known are read (in parallel), but they
+    # are notified in the same order of the walk anyway
+    read_infos = _read_mp3s_infos([full_path for full_path, mp3_info in files if mp3_info is None],
+                                  load_images, processes)
+
+    delta = ScanDelta()
+    scanned_paths = set()
+    for i, (full_path, mp3_info) in enumerate(files):
+        if callable(progress_callback):
+            progress_callback(i + 1, len(files))
+        scanned_paths.add(full_path)
+        if mp3_info is not None and full_path in current_mp3s:
+            continue # unchanged
+
+        mp3 = None
+        if mp3_info is not None:
+            mp3 = Mp3()
+            mp3.load_from_info(mp3_info)
+        else:
+            mp3_info = next(read_infos)
+            if mp3_info is not None:
+                mp3 = Mp3()
+                mp3.load_from_info(mp3_info, load_image=False)
+                if mp3_info["image"]:
+                    put_cover(mp3_info["image"], mp3.image_fingerprint)
+                _mark_unsaved(mp3)
+
+        with _library_lock:
+            idx = mp3s_indexes_by_path.get(full_path)
+            if idx is not None:
+                if mp3:
+                    delta.replaced.append(mp3s[idx])
+                    _replace_mp3(idx, mp3)
+                    delta.changed.append(mp3)
+                else:
+                    scanned_paths.discard(full_path) # not readable anymore
+            elif mp3:
+                _add_mp3(mp3)
+                delta.added.append(mp3)
+
+        if mp3 and callable(mp3_loaded_callback):
+            mp3_loaded_callback(mp3)
+
+    read_infos.close()
+
+    with _library_lock:
+        delta.removed = [mp3s[mp3s_indexes_by_path[path]] for path in current_mp3s
+                         if path not in scanned_paths and path in mp3s_indexes_by_path]
+        if delta.removed:
+            _remove_mp3s(delta.removed)
+            _mark_removed([str(mp3.path) for mp3 in delta.removed])
+
+    return delta
+
+def load_mp3s_from_info(info: dict):
+    # Fills the (empty) library with the mp3s and the directories of info
+    # (the local songs cache) as they are, without touching the files:
+    # load_mp3s() validates them afterwards
+    # (items(): the snapshot is read in one query)
+    for _, mp3_info in info["files"].items():
+        mp3 = Mp3()
+        if mp3.load_from_info(mp3_info, load_image=False):
+            with _library_lock:
+                _add_mp3(mp3)
+    with _library_lock:
+        directories.update(info.get("directories", {}).items())
+    debug(f"Loaded {len(mp3s)} mp3s from info")
 
 def clear_mp3s():
-    mp3s_indexes_by_metadata.clear()
-    mp3s.clear()
+    global library_version
+    with _library_lock:
+        mp3s_indexes_by_metadata.clear()
+        mp3s_indexes_by_path.clear()
+        mp3s_by_metadata_key.clear()
+        _clear_groups()
+        _clear_search_index()
+        library_version += 1
+        mp3s.clear()
+        directories.clear()
+    covers.clear()
+    with _unsaved_lock:
+        _unsaved_mp3s.clear()
+        _removed_mp3s.clear()
+        _unsaved_directories.clear()
+        _removed_directories.clear()
+
+# ============ SIGNALS BATCHES ===============
+# The workers emit what they load in batches (and their progress
+# at most every SIGNALS_BATCH_INTERVAL), instead of one signal per item:
+# each signal is a queued call in the GUI thread
+# ============================================
+
+class _SignalBatch:
+    def __init__(self, signal):
+        self.signal = signal
+        self.items = []
+        self.last_emit_time = time.monotonic()
+
+    def add(self, item):
+        self.items.append(item)
+        if len(self.items) >= SIGNALS_BATCH_SIZE or \
+                time.monotonic() - self.last_emit_time >= SIGNALS_BATCH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.items:
+            self.signal.emit(self.items)
+            self.items = []
+        self.last_emit_time = time.monotonic()
+
+
+class _SignalProgress:
+    def __init__(self, signal):
+        self.signal = signal
+        self.last_emit_time = None
+
+    def update(self, done: int, total: int):
+        now = time.monotonic()
+        if done == total or self.last_emit_time is None or \
+                now - self.last_emit_time >= SIGNALS_BATCH_INTERVAL:
+            self.signal.emit(done, total)
+            self.last_emit_time = now
 
 # ============ LOAD MP3s  ===============
 # Load mp3s and their tags from directory
 # =======================================
 
 class LoadMp3sWorker(Worker):
-    mp3_loaded = pyqtSignal(Mp3)
+    mp3s_loaded = pyqtSignal(list) # in batches, see _SignalBatch
+    progress = pyqtSignal(int, int) # scanned files, total files
+    scanned = pyqtSignal(ScanDelta)
 
-    def __init__(self, directory: str, info: dict, load_images):
+    def __init__(self, directory: str, info: dict, load_images, processes=1, stat_all_files=True):
         super().__init__()
         self.directory = directory
         self.info = info
         self.load_images = load_images
+        self.processes = processes
+        self.stat_all_files = stat_all_files
 
     def run(self):
         # Fetch all the releases and releases tracks for the release groups
         debug(f"LOCALSONGS: load_mp3s: '{self.directory}'")
 
-        load_mp3s(self.directory, info=self.info, mp3_loaded_callback=self._on_mp3_loaded, load_images=self.load_images)
+        batch = _SignalBatch(self.mp3s_loaded)
+        progress = _SignalProgress(self.progress)
+        delta = load_mp3s(self.directory, info=self.info, mp3_loaded_callback=batch.add,
+                          load_images=self.load_images, processes=self.processes,
+                          progress_callback=progress.update, stat_all_files=self.stat_all_files)
+        batch.flush()
+        if delta is not None:
+            self.scanned.emit(delta)
         # TODO: sort?
 
-    def _on_mp3_loaded(self, mp3: Mp3):
-        self.mp3_loaded.emit(mp3)
-
 
 def load_mp3s_background(directory,
                          info: dict=None,
-                         mp3_loaded_callback=None, finished_callback=None,
-                         load_images=True, priority=workers.Worker.PRIORITY_BELOW_NORMAL):
-    worker = LoadMp3sWorker(directory, info=info, load_images=load_images)
+                         mp3s_loaded_callback=None, finished_callback=None, scanned_callback=None,
+                         progress_callback=None,
+                         load_images=True, processes=1, stat_all_files=True,
+                         priority=workers.Worker.PRIORITY_BELOW_NORMAL):
+    worker = LoadMp3sWorker(directory, info=info, load_images=load_images, processes=processes,
+                            stat_all_files=stat_all_files)
     worker.priority = priority
-    if mp3_loaded_callback:
-        worker.mp3_loaded.connect(mp3_loaded_callback)
+    if mp3s_loaded_callback:
+        worker.mp3s_loaded.connect(mp3s_loaded_callback)
+    if progress_callback:
+        worker.progress.connect(progress_callback)
+    if scanned_callback:
+        worker.scanned.connect(scanned_callback)
     if finished_callback:
         worker.finished.connect(lambda: finished_callback(load_images))
     workers.schedule(worker)
 
 
+# ============ LOAD MP3s FROM INFO ======
+# Load mp3s from the local songs cache
+# =======================================
+
+class LoadMp3sFromInfoWorker(Worker):
+    def __init__(self, info: dict):
+        super().__init__()
+        self.info = info
+
+    def run(self):
+        debug("LOCALSONGS: load_mp3s_from_info")
+        load_mp3s_from_info(self.info)
+
+
+def load_mp3s_from_info_background(info: dict, finished_callback=None,
+                                   priority=workers.Worker.PRIORITY_ABOVE_NORMAL):
+    worker = LoadMp3sFromInfoWorker(info)
+    worker.priority = priority
+    if finished_callback:
+        worker.finished.connect(finished_callback)
+    workers.schedule(worker)
+
+
 # ============ LOAD MP3  ===============
 # Load mp3 and its tags from file
 # =======================================
@@ -304,7 +1654,8 @@ def load_mp3_background(file, mp3_loaded_callback=None, load_image=True,
 # =============================================
 
 class LoadMp3sImagesWorker(Worker):
-    mp3_image_loaded = pyqtSignal(Mp3)
+    mp3s_images_loaded = pyqtSignal(list) # in batches, see _SignalBatch
+    progress = pyqtSignal(int, int) # mp3s done, total mp3s
 
     def __init__(self):
         super().__init__()
@@ -312,18 +1663,158 @@ class LoadMp3sImagesWorker(Worker):
     def run(self):
         debug(f"LOCALSONGS: load_mp3s_images: ({len(mp3s)})")
 
-        for mp3 in mp3s:
+        batch = _SignalBatch(self.mp3s_images_loaded)
+        progress = _SignalProgress(self.progress)
+        library = list(mp3s)
+        for i, mp3 in enumerate(library):
+            image_fingerprint = mp3.image_fingerprint
             mp3.load_image()
-            self.mp3_image_loaded.emit(mp3)
+            if mp3.image_fingerprint != image_fingerprint:
+                _mark_unsaved(mp3)
+            batch.add(mp3)
+            progress.update(i + 1, len(library))
+        batch.flush()
 
 
 def load_mp3s_images_background(
-        mp3_image_loaded_callback=None, finished_callback=None,
+        mp3s_images_loaded_callback=None, finished_callback=None, progress_callback=None,
         priority=workers.Worker.PRIORITY_LOW):
     worker = LoadMp3sImagesWorker()
     worker.priority = priority
-    if mp3_image_loaded_callback:
-        worker.mp3_image_loaded.connect(mp3_image_loaded_callback)
+    if mp3s_images_loaded_callback:
+        worker.mp3s_images_loaded.connect(mp3s_images_loaded_callback)
+    if progress_callback:
+        worker.progress.connect(progress_callback)
     if finished_callback:
         worker.finished.connect(finished_callback)
     workers.schedule(worker)
+
+
+# ============ BUILD SEARCH INDEX ===============
+# Build the search index ahead of the first search
+# ===============================================
+
+class BuildSearchIndexWorker(Worker):
+    def __init__(self):
+        super().__init__()
+
+    def run(self):
+        _build_search_index()
+
+
+def build_search_index_background(priority=workers.Worker.PRIORITY_IDLE):
+    worker = BuildSearchIndexWorker()
+    worker.priority = priority
+    workers.schedule(worker)
+
+
+# ============ RESCAN DIRECTORIES ===============
+# Rescan the given directories
+# ===============================================
+
+class RescanDirectoriesWorker(Worker):
+    scanned = pyqtSignal(ScanDelta)
+
+    def __init__(self, dirs: List[str]):
+        super().__init__()
+        self.dirs = dirs
+
+    def run(self):
+        debug(f"LOCALSONGS: rescan_directories: {self.dirs}")
+        self.scanned.emit(rescan_directories(self.dirs))
+
+
+# ============ WATCHER ===============
+# Keep the library up to date with
+# the changes of the filesystem
+# ====================================
+
+class LocalSongsWatcher(QObject):
+    # Watches the scanned directories: the changed ones are collected
+    # for a while and then rescanned all together.
+    # A file rewritten in place (e.g. its tags edited by another program)
+    # does not change its directory on every platform: the files are
+    # watched too, but only up to MAX_WATCHED_FILES of them (each one
+    # takes a watch, or even a file descriptor); for bigger libraries
+    # such edits are seen only by the next refresh (not by the
+    # validation of the library at startup, see load_mp3s())
+    DEBOUNCE_MS = 300
+    MAX_WATCHED_FILES = 4096
+
+    changed = pyqtSignal(ScanDelta) # emitted once the library has been updated
+
+    def __init__(self):
+        super().__init__()
+        self.watcher = QFileSystemWatcher()
+        self.watcher.directoryChanged.connect(self._on_directory_changed)
+        self.watcher.fileChanged.connect(self._on_file_changed)
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(LocalSongsWatcher.DEBOUNCE_MS)
+        self.timer.timeout.connect(self._rescan)
+        self.dirty = set()
+        self.rescanning = False
+        self.active = False
+
+    def sync(self):
+        # watch exactly the directories of the library
+        self.active = True
+        watched = set(self.watcher.directories())
+        with _library_lock:
+            wanted = set(directories.keys())
+            wanted_files = set(f for listing in directories.values() for f in listing["files"])
+        if watched - wanted:
+            self.watcher.removePaths(list(watched - wanted))
+        if wanted - watched:
+            self.watcher.addPaths(list(wanted - watched))
+
+        watched_files = set(self.watcher.files())
+        if len(wanted_files) > LocalSongsWatcher.MAX_WATCHED_FILES:
+            wanted_files = set()
+        if watched_files - wanted_files:
+            self.watcher.removePaths(list(watched_files - wanted_files))
+        if wanted_files - watched_files:
+            self.watcher.addPaths(list(wanted_files - watched_files))
+        debug(f"LOCALSONGS: watching {len(wanted)} directories and {len(wanted_files)} files")
+
+    def stop(self):
+        # e.g. while the whole library is being scanned
+        self.active = False
+        self.timer.stop()
+        self.dirty.clear()
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        if self.watcher.files():
+            self.watcher.removePaths(self.watcher.files())
+
+    def _on_directory_changed(self, path: str):
+        debug(f"LOCALSONGS: directory changed: '{path}'")
+        self.dirty.add(path)
+        self.timer.start()
+
+    def _on_file_changed(self, path: str):
+        # (its directory is rescanned: the files are stat-ed there)
+        debug(f"LOCALSONGS: file changed: '{path}'")
+        self.dirty.add(os.path.dirname(path))
+        self.timer.start()
+
+    def _rescan(self):
+        if not self.active:
+            return
+        if self.rescanning:
+            self.timer.start() # retry when the current rescan is finished
+            return
+        dirs = sorted(self.dirty)
+        self.dirty.clear()
+        self.rescanning = True
+        worker = RescanDirectoriesWorker(dirs)
+        worker.priority = workers.Worker.PRIORITY_ABOVE_NORMAL
+        worker.scanned.connect(self._on_rescanned)
+        workers.schedule(worker)
+
+    def _on_rescanned(self, delta: ScanDelta):
+        self.rescanning = False
+        if self.active:
+            self.sync()
+        if len(delta):
+            self.changed.emit(delta)
@@ -1,4 +1,5 @@
 import argparse
+import multiprocessing
 import sys
 
 from PyQt6.QtGui import QIcon
@@ -16,6 +17,9 @@ from yt_dlp.version import __version__ as yt_dlp_version
 from yt_dlp_ejs._version import __version__  as yt_dlp_ejs_version
 
 def main():
+    # the local songs are scanned by a pool of processes
+    multiprocessing.freeze_support()
+
     utils.initialize_execution_time()
 
     parser = argparse.ArgumentParser(
@@ -54,12 +58,19 @@ def main():
     cache.initialize(images=preferences.is_images_cache_enabled(),
                      requests=preferences.is_requests_cache_enabled(),
                      localsongs=preferences.is_localsongs_cache_enabled())
+    cache.set_images_cache_limit(preferences.images_cache_max_size() * 2 ** 20)
+    cache.set_requests_cache_limit(preferences.requests_cache_max_size() * 2 ** 20)
+    cache.set_localsongs_cache_limit(preferences.localsongs_cache_max_size() * 2 ** 20)
 
     window = MainWindow()
     window.show()
 
 
-    sys.exit(app.exec())
+    ret = app.exec()
+
+    cache.close()
+
+    sys.exit(ret)
 
 
 if __name__ == '__main__':
@@ -52,6 +52,7 @@ def search_artists(query, callback, limit, priority=workers.Worker.PRIORITY_NORM
     worker.priority = priority
     worker.result.connect(callback)
     workers.schedule(worker)
+    return worker
 
 
 # ========== SEARCH RELEASE GROUPS ==========
@@ -90,6 +91,7 @@ def search_release_groups(query, callback, limit, priority=workers.Worker.PRIORI
     worker.priority = priority
     worker.result.connect(callback)
     workers.schedule(worker)
+    return worker
 
 
 # ========== SEARCH RECORDINGS ==========
@@ -139,6 +141,7 @@ def search_recordings(recording_query, artist_hint, callback, limit, priority=wo
     worker.priority = priority
     worker.result.connect(callback)
     workers.schedule(worker)
+    return worker
 
 
 # ========== SEARCH RELEASE GROUP ==========
@@ -176,6 +179,7 @@ def search_release_group(artist, album, callback, priority=workers.Worker.PRIORI
     worker.priority = priority
     worker.result.connect(callback)
     workers.schedule(worker)
+    return worker
 
 
 # ======= FETCH RELEASE GROUP COVER ======
@@ -320,6 +324,7 @@ def fetch_artist(artist_id, callback, priority=workers.Worker.PRIORITY_NORMAL):
     worker.priority = priority
     worker.result.connect(callback)
     workers.schedule(worker)
+    return worker
 
 
 # ======= FETCH RELEASE COVER ======
@@ -1,3 +1,4 @@
+import os
 from typing import Optional, Tuple
 
 from PyQt6.QtCore import QSettings, QThread
@@ -91,6 +92,16 @@ def max_simultaneous_downloads() -> int:
 def set_max_simultaneous_downloads(value: int):
     _preferences.setValue("max_simultaneous_downloads", value)
 
+# Local songs scan processes
+
+def localsongs_scan_processes() -> int:
+    x = _preferences.value("localsongs_scan_processes")
+    return int(x) if x is not None else (os.cpu_count() or 1)
+
+
+def set_localsongs_scan_processes(value: int):
+    _preferences.setValue("localsongs_scan_processes", value)
+
 # Cache
 
 def is_images_cache_enabled() -> bool:
@@ -120,6 +131,32 @@ def set_localsongs_cache_enabled(enabled: bool):
     _preferences.setValue("cache_localsongs", "1" if enabled else "0")
 
 
+# Cache limits (MB, 0 means unlimited)
+
+def images_cache_max_size() -> int:
+    return int(_preferences.value("cache_images_max_size", "1024"))
+
+
+def set_images_cache_max_size(value: int):
+    _preferences.setValue("cache_images_max_size", value)
+
+
+def requests_cache_max_size() -> int:
+    return int(_preferences.value("cache_requests_max_size", "256"))
+
+
+def set_requests_cache_max_size(value: int):
+    _preferences.setValue("cache_requests_max_size", value)
+
+
+def localsongs_cache_max_size() -> int:
+    return int(_preferences.value("cache_localsongs_max_size", "0"))
+
+
+def set_localsongs_cache_max_size(value: int):
+    _preferences.setValue("cache_localsongs_max_size", value)
+
+
 # YouTube
 
 def set_youtube_cookies_from_browser(value: str):
@@ -8,7 +8,7 @@ import requests
 from music_dragon import cache, localsongs, musicbrainz, preferences, wiki, workers, ytdownloader, ytmusic
 from music_dragon.localsongs import Mp3
 from music_dragon.log import debug
-from music_dragon.utils import Mergeable, min_index, stable_hash, normalize_metadata, crc32
+from music_dragon.utils import Mergeable, min_index, stable_hash, normalize_metadata
 from music_dragon.ytmusic import YtTrack
 
 _artists: Dict[str, 'Artist'] = {}
@@ -17,6 +17,14 @@ _releases: Dict[str, 'Release'] = {}
 _tracks: Dict[str, 'Track'] = {}
 _youtube_tracks: Dict[str, 'YtTrack'] = {}
 
+_revalidating_requests = set()
+
+# incremented whenever what the lookup of the local mp3 of the tracks
+# depends on changes (see Track._find_local()): names and aliases of the
+# artists, titles and artists of the release groups, release groups of
+# the releases; the tracks forget their own lookup when they change
+_metadata_version = 0
+
 RELEASE_GROUP_IMAGES_RELEASE_GROUP_COVER_INDEX = 0
 RELEASE_GROUP_IMAGES_RELEASES_FIRST_INDEX = 1
 
@@ -264,6 +272,10 @@ class Track(Mergeable):
         self.downloading = False
         self.title_aliases = []
 
+        # the local mp3 of the track, as of (localsongs.library_version, _metadata_version)
+        self._local_mp3 = None
+        self._local_mp3_version = None
+
         if mb_track:
             self.id = f'{mb_track["recording"]["id"]}@{release_id}'
             self.title = normalize_metadata(mb_track["recording"]["title"])
@@ -285,34 +297,52 @@ class Track(Mergeable):
         return get_youtube_track(self.youtube_track_id)
 
     def is_locally_available(self):
-        rg = self.release().release_group()
-        mp3 = localsongs.get_by_metadata(rg.artists_string(), rg.title, self.title)
-        if mp3:
-            return True
-        for alias in self.title_aliases:
-            mp3 = localsongs.get_by_metadata(rg.artists_string(), rg.title, alias)
-            if mp3:
-                return True
-        return False
+        return self.get_local() is not None
 
     def get_local(self) -> Optional[Mp3]:
-        mp3, idx = self.get_local_ext()
-        return mp3
+        version = (localsongs.library_version, _metadata_version)
+        if self._local_mp3_version != version:
+            self._local_mp3 = self._find_local()
+            self._local_mp3_version = version
+        return self._local_mp3
+
+    def _forget_local(self):
+        self._local_mp3_version = None
 
     def get_local_ext(self) -> Tuple[Optional[Mp3], Optional[int]]:
-        rg = self.release().release_group()
-        idx = localsongs.mp3s_indexes_by_metadata.get((rg.artists_string(), rg.title, self.title))
-        if idx is not None:
-            return localsongs.mp3s[idx], idx
+        mp3 = self.get_local()
+        if mp3:
+            idx = localsongs.index_of(mp3)
+            if idx is not None:
+                return mp3, idx
+            # (removed from the library meanwhile)
         return None, None
 
+    def _find_local(self) -> Optional[Mp3]:
+        rg = self.release().release_group()
+        artists = [rg.artists_string()]
+        if len(rg.artist_ids) == 1:
+            artist = get_artist(rg.artist_ids[0])
+            if artist:
+                artists += artist.aliases
+        return localsongs.find_by_metadata(artists, rg.title, [self.title] + self.title_aliases)
+
+def _metadata_changed():
+    global _metadata_version
+    _metadata_version += 1
+
 def _add_artist(artist: Artist):
     debug(f"add_artist({artist.id})")
 
     if  artist.id not in _artists:
         _artists[artist.id] = artist
+        _metadata_changed() # (artists_string() of its release groups)
     else:
-        _artists[artist.id].merge(artist)
+        existing = _artists[artist.id]
+        inputs = (existing.name, list(existing.aliases))
+        existing.merge(artist)
+        if (existing.name, existing.aliases) != inputs:
+            _metadata_changed()
     return get_artist(artist.id)
 
 def _add_release_group(release_group: ReleaseGroup):
@@ -320,7 +350,11 @@ def _add_release_group(release_group: ReleaseGroup):
     if  release_group.id not in _release_groups:
         _release_groups[release_group.id] = release_group
     else:
-        _release_groups[release_group.id].merge(release_group)
+        existing = _release_groups[release_group.id]
+        inputs = (existing.title, list(existing.artist_ids))
+        existing.merge(release_group)
+        if (existing.title, existing.artist_ids) != inputs:
+            _metadata_changed()
     return get_release_group(release_group.id)
 
 def _add_release(release: Release):
@@ -328,7 +362,11 @@ def _add_release(release: Release):
     if release.id not in _releases:
         _releases[release.id] = release
     else:
-        _releases[release.id].merge(release)
+        existing = _releases[release.id]
+        release_group_id = existing.release_group_id
+        existing.merge(release)
+        if existing.release_group_id != release_group_id:
+            _metadata_changed()
     return get_release(release.id)
 
 def _add_track(track: Track):
@@ -336,7 +374,11 @@ def _add_track(track: Track):
     if track.id not in _tracks:
         _tracks[track.id] = track
     else:
-        _tracks[track.id].merge(track)
+        existing = _tracks[track.id]
+        inputs = (existing.title, list(existing.title_aliases))
+        existing.merge(track)
+        if (existing.title, existing.title_aliases) != inputs:
+            existing._forget_local()
     return get_track(track.id)
 
 def _add_youtube_track(yttrack: YtTrack):
@@ -406,6 +448,37 @@ def get_entity(entity_id):
 # def get_track_id_by_youtube_video_id(video_id: str):
 #     return _track_id_by_video_id.get(video_id)
 
+def _revalidate_request_if_expired(request_name: str, fetch, revalidated_callback=None):
+    # The expired request has been served anyway (stale-while-revalidate):
+    # fetch it again at idle priority so that it is fresh the next time.
+    # fetch is called as fetch(callback, priority), the callback receives
+    # the result as its last argument; fetch returns the scheduled worker
+    # (None if nothing has been scheduled)
+    if request_name in _revalidating_requests or not cache.is_request_expired(request_name):
+        return
+
+    debug(f"Cached request {request_name} expired, revalidating it")
+    _revalidating_requests.add(request_name)
+
+    def callback(*args):
+        result = args[-1]
+        _revalidating_requests.discard(request_name)
+        cache.put_request(request_name, result)
+        if revalidated_callback:
+            revalidated_callback(result)
+
+    def done():
+        # (whatever the outcome: can be revalidated again if needed)
+        _revalidating_requests.discard(request_name)
+
+    worker = fetch(callback, workers.Worker.PRIORITY_IDLE)
+    if worker is None:
+        done()
+        return
+    worker.finished.connect(done)
+    worker.canceled.connect(done)
+    worker.failed.connect(done)
+
 def search_artists(query, artists_callback, artist_image_callback=None, limit=5):
     query = query.lower()
     debug(f"search_artists(query={query})")
@@ -435,6 +508,8 @@ def search_artists(query, artists_callback, artist_image_callback=None, limit=5)
         # storage cached
         cache_hit = True
         artists_callback_wrapper(query, req)
+        _revalidate_request_if_expired(request_name, lambda callback, priority:
+                                       musicbrainz.search_artists(query, callback, limit, priority=priority))
     else:
         # actually fetch
         musicbrainz.search_artists(query, artists_callback_wrapper, limit)
@@ -465,6 +540,8 @@ def search_release_groups(query, release_groups_callback, release_group_image_ca
         # storage cached
         cache_hit = True
         release_groups_callback_wrapper(query, req)
+        _revalidate_request_if_expired(request_name, lambda callback, priority:
+                                       musicbrainz.search_release_groups(query, callback, limit, priority=priority))
     else:
         # actually fetch
         musicbrainz.search_release_groups(query, release_groups_callback_wrapper, limit)
@@ -534,6 +611,9 @@ def search_tracks(query, tracks_callback, track_image_callback=None, limit=100):
         # storage cached
         cache_hit = True
         recordings_callback_wrapper(recording_query, artist_hint, req)
+        _revalidate_request_if_expired(request_name, lambda callback, priority:
+                                       musicbrainz.search_recordings(recording_query, artist_hint, callback, limit,
+                                                                     priority=priority))
     else:
         # actually fetch
         musicbrainz.search_recordings(recording_query, artist_hint, recordings_callback_wrapper, limit)
@@ -598,6 +678,9 @@ def fetch_mp3_release_group(mp3: Mp3, mp3_release_group_callback, mp3_release_gr
             # storage cached
             cache_hit = True
             release_groups_callback_wrapper(mp3.artist, mp3.album, req)
+            _revalidate_request_if_expired(request_name, lambda callback, priority:
+                                           musicbrainz.search_release_group(mp3.artist, mp3.album, callback,
+                                                                            priority=priority))
         else:
             # actually fetch
             musicbrainz.search_release_group(mp3.artist, mp3.album, release_groups_callback_wrapper)
@@ -651,6 +734,9 @@ def fetch_release_group_by_name(release_group_name: str, artist_name_hint: str,
         # storage cached
         cache_hit = True
         release_groups_callback_wrapper(release_group_name, req)
+        _revalidate_request_if_expired(request_name, lambda callback, priority:
+                                       musicbrainz.search_release_groups(release_group_name, callback, limit=limit,
+                                                                         priority=priority))
     else:
         # actually fetch
         musicbrainz.search_release_groups(release_group_name, release_groups_callback_wrapper, limit=limit)
@@ -712,6 +798,9 @@ def fetch_mp3_artist(mp3: Mp3, mp3_artist_callback, mp3_artist_image_callback):
             # storage cached
             cache_hit = True
             artists_callback_wrapper(mp3.artist, req)
+            _revalidate_request_if_expired(request_name, lambda callback, priority:
+                                           musicbrainz.search_artists(mp3.artist, callback, limit=limit,
+                                                                      priority=priority))
         else:
             # actually fetch
             musicbrainz.search_artists(mp3.artist, artists_callback_wrapper, limit=limit)
@@ -761,6 +850,9 @@ def fetch_artist_by_name(artist_name: str, artist_callback, artist_image_callbac
         # storage cached
         cache_hit = True
         artists_callback_wrapper(artist_name, req)
+        _revalidate_request_if_expired(request_name, lambda callback, priority:
+                                       musicbrainz.search_artists(artist_name, callback, limit=limit,
+                                                                  priority=priority))
     else:
         # actually fetch
         musicbrainz.search_artists(artist_name, artists_callback_wrapper, limit=limit)
@@ -781,6 +873,12 @@ def fetch_release_group_cover(release_group_id: str, release_group_cover_callbac
             rg.fetched_front_cover = True
             rg.front_cover = img
             release_group_cover_callback(release_group_id, rg.front_cover)
+        elif cache.is_image_missing(f"{rg.id}"):
+            # storage cached as missing, don't look for it again
+            debug(f"Release group ({release_group_id}) is known to have no cover")
+            rg.fetched_front_cover = True
+            rg.front_cover = bytes()
+            release_group_cover_callback(release_group_id, rg.front_cover)
         else:
             # actually fetch
             debug(f"Release group ({release_group_id}) cover not fetched yet")
@@ -859,6 +957,9 @@ def fetch_release_group_releases(release_group_id: str, release_group_releases_c
                     # storage cached
                     cache_hit2 = True
                     search_youtube_album_tracks_callback(rg.artists_string(), rg.title, req2)
+                    _revalidate_request_if_expired(request_name2, lambda callback, priority_:
+                                                   ytmusic.search_youtube_album(rg.artists_string(), rg.title, callback,
+                                                                                priority=priority_))
                 else:
                     # actually fetch
                     debug("Fetching now video ids")
@@ -914,6 +1015,12 @@ def fetch_artist(artist_id, artist_callback, artist_image_callback=None):
                     artist.fetched_image = True
                     artist.image = img
                     artist_image_callback(artist_id, img)
+                elif cache.is_image_missing(f"{artist.id}"):
+                    # storage cached as missing, don't look for it again
+                    debug("Artist is known to have no image")
+                    artist.fetched_image = True
+                    artist.image = bytes()
+                    artist_image_callback(artist_id, artist.image)
                 else:
                     # actually fetch
                     debug("Retrieving artist image too")
@@ -924,19 +1031,34 @@ def fetch_artist(artist_id, artist_callback, artist_image_callback=None):
                         cache.put_image(f"{artist.id}", image) # write also null images
                         artist_image_callback(artist_id_, image)
 
+                    wiki_id = None
                     if "url-relation-list" in result:
                         for url in result["url-relation-list"]:
                             if url["type"] == "wikidata":
                                 wiki_id = url["target"].split("/")[-1]
-                                # does not make sense to cache this requests since we will cache the image
-                                wiki.fetch_wikidata_image(wiki_id, artist_image_callback_wrapper, user_data=artist_id)
                                 break
+                    if wiki_id:
+                        # does not make sense to cache this requests since we will cache the image
+                        wiki.fetch_wikidata_image(wiki_id, artist_image_callback_wrapper, user_data=artist_id)
+                    else:
+                        # no image to look for at all
+                        cache.put_missing_image(f"{artist.id}")
 
         req = cache.get_request(request_name)
         if req:
             # storage cached
             cache_hit = True
             artist_callback_wrapper(artist_id, req)
+
+            def artist_revalidated_callback(result: dict):
+                # pick up the (eventually) new release groups
+                artist_ = get_artist(artist_id)
+                if artist_:
+                    artist_.release_group_ids = Artist(result).release_group_ids
+
+            _revalidate_request_if_expired(request_name, lambda callback, priority:
+                                           musicbrainz.fetch_artist(artist_id, callback, priority=priority),
+                                           artist_revalidated_callback)
         else:
             # actually fetch
             musicbrainz.fetch_artist(artist_id, artist_callback_wrapper)
@@ -957,6 +1079,12 @@ def fetch_release_cover(release_id: str, release_cover_callback):
             r.fetched_front_cover = True
             r.front_cover = img
             release_cover_callback(release_id, r.front_cover)
+        elif cache.is_image_missing(f"{r.id}"):
+            # storage cached as missing, don't look for it again
+            debug(f"Release ({release_id}) is known to have no cover")
+            r.fetched_front_cover = True
+            r.front_cover = bytes()
+            release_cover_callback(release_id, r.front_cover)
         else:
             # actually fetch
             debug(f"Release ({release_id}) cover not fetched yet")
@@ -1198,6 +1326,7 @@ def _set_release_group_tracks(release_group_id, playlist_id, yttracks: List[YtTr
             # add the yt title as an alias
             if yttrack.song != closest_track.title and yttrack.song not in closest_track.title_aliases:
                 closest_track.title_aliases.append(yttrack.song)
+                closest_track._forget_local()
             # _track_id_by_video_id[yttrack.video_id] = closest_track.id
             debug(
                 f"YtTrack '{yttrack.song} (#{yttrack.track_number})' <==> '{closest_track.title} (#{closest_track.track_number})' (association score {min(closest_tracks_scores)})")
@@ -1567,44 +1696,49 @@ def download_youtube_track(track_id: str,
 def cancel_youtube_track_download(video_id: str):
     ytdownloader.cancel_track_download(video_id)
 
+def update_localsongs_cache(*args, **kwargs):
+    # Only what changed since the last update is written
+    files, removed_files, directories, removed_directories = localsongs.take_unsaved_changes()
+    if files or removed_files or directories or removed_directories:
+        cache.update_localsongs(files, removed_files, directories, removed_directories)
+
+    # Save images: only the covers that can't be read back from the files,
+    # once per album rather than per song
+    for img_fingerprint_, image in list(localsongs.covers.items()):
+        if not cache.has_file(img_fingerprint_):
+            cache.put_image(img_fingerprint_, image)
+
+def update_localsongs_cache_background():
+    workers.schedule_function(update_localsongs_cache)
+
+def _on_localsongs_cache_cleared(finished_callback=None):
+    # the snapshot may have been cleared after the library was saved:
+    # what's in memory is written again
+    localsongs.mark_all_unsaved()
+    update_localsongs_cache_background()
+    if callable(finished_callback):
+        finished_callback()
+
+def clear_cache_background(finished_callback=None):
+    cache.clear_background(lambda: _on_localsongs_cache_cleared(finished_callback))
+
+def clear_localsongs_cache_background(finished_callback=None):
+    cache.clear_localsongs_background(lambda: _on_localsongs_cache_cleared(finished_callback))
+
 def load_mp3s(directory: str,
-              mp3_loaded_callback,
-              mp3_image_loaded_callback,
+              mp3s_batch_loaded_callback,
+              mp3s_batch_images_loaded_callback,
               mp3s_loaded_callback,
-              mp3s_images_loaded_callback):
-
-    def update_localsongs_cache(*args, **kwargs):
-        debug("Computing local songs info...")
-        info = {}
-
-        for mp3 in localsongs.mp3s:
-            img_fingerprint_ = str(crc32(mp3.image)) if mp3.image else None
-
-            # Add info
-            info[str(mp3.path)] = {
-                "path": str(mp3.path),
-                "length": mp3.length,
-                "artist": mp3.artist,
-                "album": mp3.album,
-                "song": mp3.song,
-                "track_num": mp3.track_num,
-                "year": mp3.year,
-                "size": mp3.size,
-                "image_fingerprint": img_fingerprint_,
-            }
-
-            # Save image
-            if img_fingerprint_ is not None and not cache.has_file(img_fingerprint_):
-                cache.put_image(img_fingerprint_, mp3.image)
-
-        debug("Local songs info computed")
-        cache.put_localsongs(info)
+              mp3s_images_loaded_callback,
+              mp3s_scanned_callback=None,
+              mp3s_loaded_from_cache_callback=None,
+              mp3s_scan_progress_callback=None):
 
     def mp3s_images_loaded_callback_wrapper():
         mp3s_images_loaded_callback()
 
         # Update cache
-        workers.schedule_function(update_localsongs_cache)
+        update_localsongs_cache_background()
 
     def mp3s_loaded_callback_wrapper(_1):
         mp3s_loaded_callback(_1)
@@ -1612,23 +1746,37 @@ def load_mp3s(directory: str,
         # Load images
         debug("Loading images now")
         localsongs.load_mp3s_images_background(
-            mp3_image_loaded_callback=mp3_image_loaded_callback,
+            mp3s_images_loaded_callback=mp3s_batch_images_loaded_callback,
             finished_callback=mp3s_images_loaded_callback_wrapper)
 
+    def load_mp3s_from_directory(stat_all_files=True):
+        # (if the library is not empty only what changed is loaded)
+        localsongs.load_mp3s_background(directory,
+                                        info=localsongs_info,
+                                        mp3s_loaded_callback=mp3s_batch_loaded_callback,
+                                        finished_callback=mp3s_loaded_callback_wrapper,
+                                        scanned_callback=mp3s_scanned_callback,
+                                        progress_callback=mp3s_scan_progress_callback,
+                                        load_images=False,
+                                        processes=preferences.localsongs_scan_processes(),
+                                        stat_all_files=stat_all_files)
+
+    def mp3s_loaded_from_cache_callback_wrapper():
+        if mp3s_loaded_from_cache_callback:
+            mp3s_loaded_from_cache_callback()
+
+        # Validate against the files
+        # (quickly: the files of the directories not changed are not stat-ed)
+        load_mp3s_from_directory(stat_all_files=False)
+
     # Load local songs info
+    # (images are linked through their fingerprint and read from the cache)
     localsongs_info = cache.get_localsongs()
 
-    if localsongs_info:
-        # Link mp3s info with images
-        for _1, mp3_info in localsongs_info.items():
-            img_fingerprint = mp3_info.get("image_fingerprint")
-            if img_fingerprint is not None:
-                mp3_info["image"] = cache._cache_path / img_fingerprint
-
-    # Load mp3s from info
-    localsongs.load_mp3s_background(directory,
-                                    info=localsongs_info,
-                                    mp3_loaded_callback=mp3_loaded_callback,
-                                    finished_callback=mp3s_loaded_callback_wrapper,
-                                    load_images=False)
+    if localsongs_info and not localsongs.mp3s:
+        # Show the library as it was right away, then validate it
+        localsongs.load_mp3s_from_info_background(
+            localsongs_info, finished_callback=mp3s_loaded_from_cache_callback_wrapper)
+    else:
+        load_mp3s_from_directory()
 
@@ -1,4 +1,4 @@
-from typing import Any, Optional
+from typing import Any, Optional, List
 
 from PyQt6.QtCore import Qt, QSize, QRect, QPoint, QModelIndex, QAbstractListModel, QVariant, pyqtSignal, \
     QSortFilterProxyModel, QRectF
@@ -9,15 +9,16 @@ from PyQt6.QtWidgets import QStyledItemDelegate, QWidget, QLabel, QSizePolicy, Q
 from music_dragon import localsongs, favourites, UNKNOWN_ALBUM, UNKNOWN_ARTIST
 from music_dragon.localsongs import Mp3
 from music_dragon.log import debug
-from music_dragon.ui import resources
+from music_dragon.ui import resources, thumbnails
 from music_dragon.ui.clickablelabel import ClickableLabel
 from music_dragon.ui.listproxyview import ListProxyView
-from music_dragon.utils import make_icon_from_data
+from music_dragon.ui.modelutils import update_rows, insert_rows, remove_rows, find_row
 
 class LocalAlbumsItemRole:
     TITLE = Qt.ItemDataRole.DisplayRole
     IMAGE = Qt.ItemDataRole.DecorationRole
     ARTIST = Qt.ItemDataRole.UserRole
+    MP3 = Qt.ItemDataRole.UserRole + 1
 
 
 class LocalAlbumsItemWidget(QWidget):
@@ -139,7 +140,7 @@ class LocalAlbumsItemDelegate(QStyledItemDelegate):
 
         title: str = index.data(LocalAlbumsItemRole.TITLE)
         artist: str = index.data(LocalAlbumsItemRole.ARTIST)
-        image: bytes = index.data(LocalAlbumsItemRole.IMAGE)
+        mp3: Mp3 = index.data(LocalAlbumsItemRole.MP3)
 
         main_rect = option.rect
         x = main_rect.x()
@@ -148,10 +149,15 @@ class LocalAlbumsItemDelegate(QStyledItemDelegate):
         h = main_rect.height()
 
         # Icon
-        icon = make_icon_from_data(image, default=resources.COVER_PLACEHOLDER_ICON)
         icon_size = QSize(48, 48)
         icon_rect = QRect(x, y, icon_size.width(), icon_size.height())
-        icon.paint(painter, icon_rect)
+        thumbnail = thumbnails.get_thumbnail(
+            mp3, thumbnails.thumbnail_size(icon_size.width(), painter.device().devicePixelRatioF()),
+            thumbnail_ready_callback=option.widget.update if option.widget else None)
+        if thumbnail:
+            painter.drawPixmap(icon_rect, thumbnail)
+        else:
+            resources.COVER_PLACEHOLDER_ICON.paint(painter, icon_rect)
         # debug(f"Drawing icon of size {icon_size}")
 
         # Title
@@ -229,25 +235,51 @@ class LocalAlbumsModel(QAbstractListModel):
         super().__init__()
         self.localalbums = []
 
-    def reload(self):
-        def is_better(m1: Mp3, m2: Mp3):
-            if m1.year and not m2.year:
-                return True
-            if m1.image and not m2.image:
-                return True
-            if m1.year and m2.year and m1.year < m2.year:
-                return True
-            return False
-
-        mp3s_by_albums = {}
-        for mp3 in localsongs.mp3s:
-            if not mp3.album and (UNKNOWN_ALBUM not in mp3s_by_albums or is_better(mp3, mp3s_by_albums[UNKNOWN_ALBUM])):
-                mp3s_by_albums[UNKNOWN_ALBUM] = mp3
-            if mp3.album and (mp3.album not in mp3s_by_albums or is_better(mp3, mp3s_by_albums[mp3.album])):
-                mp3s_by_albums[mp3.album] = mp3
-
-        self.localalbums = list(mp3s_by_albums.values())
-        self.localalbums = sorted(self.localalbums, key=lambda mp3: (mp3.album or "ZZZZZZZZZZZZZZZZZZZZZZZ").lower())
+    @staticmethod
+    def _is_better(m1: Mp3, m2: Mp3):
+        if m1.year and not m2.year:
+            return True
+        if m1.has_image() and not m2.has_image():
+            return True
+        if m1.year and m2.year and m1.year < m2.year:
+            return True
+        return False
+
+    def _group_leader(self, album: Optional[str]) -> Optional[Mp3]:
+        # (albums with the same title are shown once, whatever the artist)
+        leader = None
+        for artist in localsongs.artists_of_album(album):
+            for mp3 in localsongs.tracks_of_album(artist, album):
+                if leader is None or self._is_better(mp3, leader):
+                    leader = mp3
+        return leader
+
+    def _entries(self):
+        albums = {album for _, album, _ in localsongs.albums()}
+        return sorted([self._group_leader(album) for album in albums], key=LocalAlbumsModel._sort_key)
+
+    @staticmethod
+    def _album_key(album: Optional[str]):
+        return (album or "ZZZZZZZZZZZZZZZZZZZZZZZ").lower(), album or ""
+
+    @staticmethod
+    def _sort_key(mp3: Mp3):
+        return LocalAlbumsModel._album_key(mp3.album)
+
+    def update(self):
+        # notifies only the rows that changed
+        update_rows(self, self.localalbums, self._entries(), key=LocalAlbumsModel._sort_key)
+
+    def refresh(self, mp3s: List[Mp3]):
+        # updates only the albums of the given mp3s (added, changed or removed)
+        for album in {mp3.album or None for mp3 in mp3s}:
+            leader = self._group_leader(album)
+            if leader:
+                insert_rows(self, self.localalbums, [leader], key=LocalAlbumsModel._sort_key)
+                continue
+            row = find_row(self.localalbums, LocalAlbumsModel._album_key(album), key=LocalAlbumsModel._sort_key)
+            if row is not None:
+                remove_rows(self, self.localalbums, [self.localalbums[row]], key=LocalAlbumsModel._sort_key)
 
     def flags(self, index: QModelIndex) -> Qt.ItemFlag:
         return super().flags(index) | Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsSelectable
@@ -282,6 +314,9 @@ class LocalAlbumsModel(QAbstractListModel):
         if role == LocalAlbumsItemRole.IMAGE:
             return mp3.image
 
+        if role == LocalAlbumsItemRole.MP3:
+            return mp3
+
         return QVariant()
 
     def update_row(self, row, roles=None):
@@ -67,12 +67,7 @@ class LocalAlbumTracksModel(ListWidgetModel):
     def set(self, mp3: Mp3):
         self.artist = mp3.artist
         self.album = mp3.album
-        self.mp3s = []
-        for mp3 in localsongs.mp3s:
-            if mp3.artist == self.artist and mp3.album == self.album:
-                self.mp3s.append(mp3)
-
-        self.mp3s = sorted(self.mp3s, key=lambda mp3: mp3.track_num or 9999)
+        self.mp3s = sorted(localsongs.tracks_of_album(self.artist, self.album), key=lambda mp3: mp3.track_num or 9999)
 
     def entries(self) -> List:
         return self.mp3s
@@ -99,15 +99,15 @@ class LocalArtistAlbumsModel(ListWidgetModel):
         def is_better(m1: Mp3, m2: Mp3):
             if m1.year and not m2.year:
                 return True
-            if m1.image and not m2.image:
+            if m1.has_image() and not m2.has_image():
                 return True
             return False
         self.artist = mp3.artist
         albums = {}
-        for mp3 in localsongs.mp3s:
-            if mp3.artist == self.artist:
-                if mp3.album not in albums or is_better(mp3, albums[mp3.album]):
-                    albums[mp3.album] = mp3
+        for album in localsongs.albums_of_artist(self.artist):
+            for mp3 in localsongs.tracks_of_album(self.artist, album):
+                if album not in albums or is_better(mp3, albums[album]):
+                    albums[album] = mp3
 
         debug([mp3.title() for mp3 in albums.values()])
         self.albums = sorted(list(albums.values()), key=lambda a: a.year or 9999)
@@ -1,4 +1,4 @@
-from typing import Any, Optional
+from typing import Any, Optional, List
 
 from PyQt6.QtCore import Qt, QSize, QRect, QPoint, QModelIndex, QAbstractListModel, QVariant, pyqtSignal, \
     QSortFilterProxyModel, QRectF
@@ -9,13 +9,14 @@ from PyQt6.QtWidgets import QStyledItemDelegate, QListView, QWidget, QLabel, QSi
 from music_dragon import localsongs, favourites, UNKNOWN_ARTIST
 from music_dragon.localsongs import Mp3
 from music_dragon.log import debug
-from music_dragon.ui import resources
+from music_dragon.ui import resources, thumbnails
 from music_dragon.ui.listproxyview import ListProxyView
-from music_dragon.utils import make_icon_from_data
+from music_dragon.ui.modelutils import update_rows, insert_rows, remove_rows, find_row
 
 class LocalArtistsItemRole:
     NAME = Qt.ItemDataRole.DisplayRole
     IMAGE = Qt.ItemDataRole.DecorationRole
+    MP3 = Qt.ItemDataRole.UserRole
 
 
 class LocalArtistsItemWidget(QWidget):
@@ -98,7 +99,7 @@ class LocalArtistsItemDelegate(QStyledItemDelegate):
         painter.save()
 
         name: str = index.data(LocalArtistsItemRole.NAME)
-        image: bytes = index.data(LocalArtistsItemRole.IMAGE)
+        mp3: Mp3 = index.data(LocalArtistsItemRole.MP3)
 
         main_rect = option.rect
         x = main_rect.x()
@@ -107,10 +108,15 @@ class LocalArtistsItemDelegate(QStyledItemDelegate):
         h = main_rect.height()
 
         # Icon
-        icon = make_icon_from_data(image, default=resources.PERSON_PLACEHOLDER_ICON)
         icon_size = QSize(48, 48)
         icon_rect = QRect(x, y, icon_size.width(), icon_size.height())
-        icon.paint(painter, icon_rect)
+        thumbnail = thumbnails.get_thumbnail(
+            mp3, thumbnails.thumbnail_size(icon_size.width(), painter.device().devicePixelRatioF()),
+            thumbnail_ready_callback=option.widget.update if option.widget else None)
+        if thumbnail:
+            painter.drawPixmap(icon_rect, thumbnail)
+        else:
+            resources.PERSON_PLACEHOLDER_ICON.paint(painter, icon_rect)
         # debug(f"Drawing icon of size {icon_size}")
 
         # Title
@@ -164,26 +170,50 @@ class LocalArtistsModel(QAbstractListModel):
         super().__init__()
         self.localartists = []
 
-    def reload(self):
-        def is_better(m1: Mp3, m2: Mp3):
-            if m1.year and not m2.year:
-                return True
-            if m1.image and not m2.image:
-                return True
-            if m1.year and m2.year and m1.year < m2.year:
-                return True
-            return False
-
-        mp3s_by_artists = {}
-        for mp3 in localsongs.mp3s:
-            if not mp3.artist and (UNKNOWN_ARTIST not in mp3s_by_artists or is_better(mp3, mp3s_by_artists[UNKNOWN_ARTIST])):
-                mp3s_by_artists[UNKNOWN_ARTIST] = mp3
-            if mp3.artist and (mp3.artist not in mp3s_by_artists or is_better(mp3, mp3s_by_artists[mp3.artist])):
-                mp3s_by_artists[mp3.artist] = mp3
-
-
-        self.localartists = list(mp3s_by_artists.values())
-        self.localartists = sorted(self.localartists, key=lambda mp3: (mp3.artist or "ZZZZZZZZZZZZZZZZZZZZZZZ").lower()) # TODO: better way
+    @staticmethod
+    def _is_better(m1: Mp3, m2: Mp3):
+        if m1.year and not m2.year:
+            return True
+        if m1.has_image() and not m2.has_image():
+            return True
+        if m1.year and m2.year and m1.year < m2.year:
+            return True
+        return False
+
+    def _group_leader(self, artist: Optional[str]) -> Optional[Mp3]:
+        leader = None
+        for mp3 in localsongs.tracks_of_artist(artist):
+            if leader is None or self._is_better(mp3, leader):
+                leader = mp3
+        return leader
+
+    def _entries(self):
+        leaders = [self._group_leader(artist) for artist in localsongs.artists()]
+        return sorted(leaders, key=LocalArtistsModel._sort_key)
+
+    @staticmethod
+    def _artist_key(artist: Optional[str]):
+        # TODO: better way
+        return (artist or "ZZZZZZZZZZZZZZZZZZZZZZZ").lower(), artist or ""
+
+    @staticmethod
+    def _sort_key(mp3: Mp3):
+        return LocalArtistsModel._artist_key(mp3.artist)
+
+    def update(self):
+        # notifies only the rows that changed
+        update_rows(self, self.localartists, self._entries(), key=LocalArtistsModel._sort_key)
+
+    def refresh(self, mp3s: List[Mp3]):
+        # updates only the artists of the given mp3s (added, changed or removed)
+        for artist in {mp3.artist or None for mp3 in mp3s}:
+            leader = self._group_leader(artist)
+            if leader:
+                insert_rows(self, self.localartists, [leader], key=LocalArtistsModel._sort_key)
+                continue
+            row = find_row(self.localartists, LocalArtistsModel._artist_key(artist), key=LocalArtistsModel._sort_key)
+            if row is not None:
+                remove_rows(self, self.localartists, [self.localartists[row]], key=LocalArtistsModel._sort_key)
 
     # def flags(self, index: QModelIndex) -> Qt.ItemFlags:
     #     return super().flags(index) | Qt.ItemIsEditable | Qt.ItemIsSelectable
@@ -212,6 +242,9 @@ class LocalArtistsModel(QAbstractListModel):
         if role == LocalArtistsItemRole.IMAGE:
             return mp3_group.image
 
+        if role == LocalArtistsItemRole.MP3:
+            return mp3_group
+
         return QVariant()
 
     def update_row(self, row, roles=None):
@@ -1,4 +1,4 @@
-from typing import Any, Optional
+from typing import Any, Optional, Set, List
 
 from PyQt6.QtCore import Qt, QSize, QRect, QPoint, QModelIndex, QAbstractListModel, QVariant, pyqtSignal, \
     QSortFilterProxyModel
@@ -7,11 +7,12 @@ from PyQt6.QtWidgets import QStyledItemDelegate, QWidget, QLabel, QSizePolicy, Q
     QGridLayout, QListView
 
 from music_dragon import localsongs
+from music_dragon.localsongs import Mp3
 from music_dragon.log import debug
-from music_dragon.ui import resources
+from music_dragon.ui import resources, thumbnails
 from music_dragon.ui.clickablelabel import ClickableLabel
 from music_dragon.ui.listproxyview import ListProxyView
-from music_dragon.utils import make_icon_from_data
+from music_dragon.ui.modelutils import update_rows, insert_rows, remove_rows, find_row
 
 
 class LocalSongsItemRole:
@@ -19,6 +20,7 @@ class LocalSongsItemRole:
     IMAGE = Qt.ItemDataRole.DecorationRole
     ARTIST = Qt.ItemDataRole.UserRole
     ALBUM = Qt.ItemDataRole.UserRole + 1
+    MP3 = Qt.ItemDataRole.UserRole + 2
 
 
 class LocalSongsItemWidget(QWidget):
@@ -171,7 +173,7 @@ class LocalSongsItemDelegate(QStyledItemDelegate):
         song: str = index.data(LocalSongsItemRole.SONG)
         artist: str = index.data(LocalSongsItemRole.ARTIST)
         album: str = index.data(LocalSongsItemRole.ALBUM)
-        image: bytes = index.data(LocalSongsItemRole.IMAGE)
+        mp3: Mp3 = index.data(LocalSongsItemRole.MP3)
 
         main_rect = option.rect
         x = main_rect.x()
@@ -180,10 +182,15 @@ class LocalSongsItemDelegate(QStyledItemDelegate):
         h = main_rect.height()
 
         # Icon
-        icon = make_icon_from_data(image, default=resources.COVER_PLACEHOLDER_ICON)
         icon_size = QSize(48, 48)
         icon_rect = QRect(x, y, icon_size.width(), icon_size.height())
-        icon.paint(painter, icon_rect)
+        thumbnail = thumbnails.get_thumbnail(
+            mp3, thumbnails.thumbnail_size(icon_size.width(), painter.device().devicePixelRatioF()),
+            thumbnail_ready_callback=option.widget.update if option.widget else None)
+        if thumbnail:
+            painter.drawPixmap(icon_rect, thumbnail)
+        else:
+            resources.COVER_PLACEHOLDER_ICON.paint(painter, icon_rect)
         # debug(f"Drawing icon of size {icon_size}")
 
         # Title
@@ -257,23 +264,85 @@ class LocalSongsItemDelegate(QStyledItemDelegate):
 
 
 class LocalSongsProxyModel(QSortFilterProxyModel):
+    # Filters the songs through the search index of localsongs:
+    # the mp3s matching the filter are searched once per filter
+    # (and before the source model changes, if the library did),
+    # then only the rows whose match changed are filtered again
+    # (by notifying them as changed: needs dynamicSortFilter)
+    def __init__(self):
+        super().__init__()
+        self.filter_text = ""
+        self.matches: Optional[Set[Mp3]] = None
+        self.matches_library_version = None
+
+    def setSourceModel(self, source_model: 'LocalSongsModel'):
+        super().setSourceModel(source_model)
+        source_model.about_to_change.connect(self._on_source_about_to_change)
+
+    def set_filter_text(self, filter_text: str):
+        self.filter_text = filter_text
+        self._update_matches()
+
+    def _on_source_about_to_change(self):
+        if self.matches_library_version != localsongs.library_version:
+            self._update_matches()
+
+    def _update_matches(self):
+        # (the version is read before searching: the scan may change the library meanwhile)
+        self.matches_library_version = localsongs.library_version
+        old_matches = self.matches
+        self.matches = localsongs.search(self.filter_text)
+
+        if old_matches is None or self.matches is None:
+            if old_matches is not self.matches:
+                self.invalidateFilter()
+            return
+
+        source = self.sourceModel()
+        rows = sorted(row for row in (source.row_of(mp3) for mp3 in old_matches ^ self.matches)
+                      if row is not None)
+        if len(rows) > source.rowCount() // 2:
+            self.invalidateFilter() # (cheaper at once)
+            return
+
+        # notified in ranges of consecutive rows
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or rows[i] != rows[i - 1] + 1:
+                source.dataChanged.emit(source.index(rows[start]), source.index(rows[i - 1]),
+                                        [self.filterRole()])
+                start = i
+
     def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
-        src = self.sourceModel()
-        index = src.index(source_row, 0, source_parent)
-        song = src.data(index, LocalSongsItemRole.SONG)
-        artist = src.data(index, LocalSongsItemRole.ARTIST)
-        album = src.data(index, LocalSongsItemRole.ALBUM)
-        reg_exp = self.filterRegularExpression()
-        return reg_exp.match(song).hasMatch() or reg_exp.match(artist).hasMatch() or reg_exp.match(album).hasMatch()
+        if self.matches is None:
+            return True
+        return self.sourceModel().entry(source_row) in self.matches
 
 class LocalSongsModel(QAbstractListModel):
+    about_to_change = pyqtSignal() # emitted before the rows are changed, see LocalSongsProxyModel
+
     def __init__(self):
         super().__init__()
         self.localsongs = []
 
-    def reload(self):
-        self.localsongs = [mp3 for mp3 in localsongs.mp3s]
-        self.localsongs = sorted(self.localsongs, key=lambda mp3: mp3.title().lower())
+    @staticmethod
+    def _sort_key(mp3: Mp3):
+        return mp3.title().lower(), str(mp3.path)
+
+    def update(self):
+        # notifies only the rows that changed
+        self.about_to_change.emit()
+        update_rows(self, self.localsongs, sorted(localsongs.mp3s, key=LocalSongsModel._sort_key),
+                    key=LocalSongsModel._sort_key)
+
+    def add(self, mp3s: List[Mp3]):
+        # inserts the mp3s at their place (or replaces the ones with the same key)
+        self.about_to_change.emit()
+        insert_rows(self, self.localsongs, mp3s, key=LocalSongsModel._sort_key)
+
+    def remove(self, mp3s: List[Mp3]):
+        self.about_to_change.emit()
+        remove_rows(self, self.localsongs, mp3s, key=LocalSongsModel._sort_key)
 
     def flags(self, index: QModelIndex):
         return super().flags(index) | Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsSelectable
@@ -284,6 +353,10 @@ class LocalSongsModel(QAbstractListModel):
     def entry(self, row: int):
         return self.localsongs[row]
 
+    def row_of(self, mp3: Mp3) -> Optional[int]:
+        row = find_row(self.localsongs, LocalSongsModel._sort_key(mp3), key=LocalSongsModel._sort_key)
+        return row if row is not None and self.localsongs[row] is mp3 else None
+
     def data(self, index: QModelIndex, role: int = ...) -> Any:
         if not index.isValid():
             return QVariant()
@@ -311,6 +384,9 @@ class LocalSongsModel(QAbstractListModel):
         if role == LocalSongsItemRole.IMAGE:
             return mp3.image
 
+        if role == LocalSongsItemRole.MP3:
+            return mp3
+
         return QVariant()
 
     def update_row(self, row, roles=None):
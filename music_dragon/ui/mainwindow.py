@@ -256,13 +256,20 @@ class MainWindow(QMainWindow):
         self.ui.localSongsRandomPlayButton.clicked.connect(self.on_local_songs_random_play_button_clicked)
 
 
+        # Keep local songs up to date with the filesystem
+        self.local_songs_watcher = localsongs.LocalSongsWatcher()
+        self.local_songs_watcher.changed.connect(self.on_local_songs_changed)
+
         # Load local songs
         # TODO: preferences flag?
         repository.load_mp3s(preferences.directory(),
-                                        mp3_loaded_callback=self.on_mp3_loaded,
-                                        mp3_image_loaded_callback=self.on_mp3_image_loaded,
+                                        mp3s_batch_loaded_callback=self.on_mp3s_batch_loaded,
+                                        mp3s_batch_images_loaded_callback=self.on_mp3s_batch_images_loaded,
                                         mp3s_loaded_callback=self.on_mp3s_loaded,
-                                        mp3s_images_loaded_callback=self.on_mp3s_images_loaded)
+                                        mp3s_images_loaded_callback=self.on_mp3s_images_loaded,
+                                        mp3s_scanned_callback=self.on_mp3s_scanned,
+                                        mp3s_loaded_from_cache_callback=self.on_mp3s_loaded_from_cache,
+                                        mp3s_scan_progress_callback=self.on_mp3s_scan_progress)
 
         # Play
         self.ui.playPauseButton.clicked.connect(self.on_play_pause_button_clicked)
@@ -296,6 +303,9 @@ class MainWindow(QMainWindow):
         # Save geometry
         preferences.set_geometry_and_state(self.saveGeometry(), self.saveState())
 
+        # Commit the cache writes still pending
+        cache.flush()
+
     def set_local_page(self):
         self.push_page(self.ui.localPage)
 
@@ -1222,11 +1232,9 @@ class MainWindow(QMainWindow):
         self.update_album_download_widgets()
         self.update_album_cover_state()
 
-        debug("Reloading mp3s model")
+        debug("Updating mp3s model")
         self.update_local_song_count()
-        self.local_songs_model.beginResetModel()
-        self.local_songs_model.reload()
-        self.local_songs_model.endResetModel()
+        self.local_songs_model.update()
 
         if down["user_data"]["type"] == "official":
             track_id = down["user_data"]["id"]
@@ -1310,7 +1318,7 @@ class MainWindow(QMainWindow):
     def on_local_album_random_play_button_clicked(self):
         artist = self.current_local_album_mp3_group_leader.artist
         album = self.current_local_album_mp3_group_leader.album
-        queue = [mp3 for mp3 in localsongs.mp3s if mp3.artist == artist and mp3.album == album]
+        queue = localsongs.tracks_of_album(artist, album)
         random.shuffle(queue)
         self.play(0, queue)
 
@@ -1329,7 +1337,7 @@ class MainWindow(QMainWindow):
 
     def on_local_artist_random_play_button_clicked(self):
         artist = self.current_local_artist_mp3_group_leader.artist
-        queue = [mp3 for mp3 in localsongs.mp3s if mp3.artist == artist]
+        queue = localsongs.tracks_of_artist(artist)
         random.shuffle(queue)
         self.play(0, queue)
 
@@ -1419,50 +1427,92 @@ class MainWindow(QMainWindow):
             self.open_release_group_by_name(release_group_name=down["album"], artist_name_hint=down["artist"])
 
 
-    def on_mp3_loaded(self, mp3: Mp3):
+    def on_mp3s_batch_loaded(self, mp3s: List[Mp3]):
+        # (added or changed) shown as they are loaded
+        self.add_local_songs_artists_albums(mp3s)
         self.update_local_song_count()
 
-    def on_mp3s_loaded(self, with_images):
-        # self.ui.localSongs.invalidate()
-        debug("Reloading mp3s model")
+    def on_mp3s_scan_progress(self, scanned: int, total: int):
+        if scanned < total:
+            self.ui.localSongCount.setText(f"{len(localsongs.mp3s)} songs (scanning {scanned}/{total})")
+        else:
+            self.update_local_song_count()
+
+    def on_mp3s_loaded_from_cache(self):
+        debug("Local songs loaded from cache")
         self.reload_local_songs_artists_albums()
+        self.update_local_song_count()
+        localsongs.build_search_index_background()
 
-    def on_mp3_image_loaded(self, mp3: Mp3):
+    def on_mp3s_loaded(self, with_images):
+        # (the models are already up to date, see on_mp3s_batch_loaded and on_mp3s_scanned)
+        self.local_songs_watcher.sync()
+        localsongs.build_search_index_background()
+
+    def on_mp3s_batch_images_loaded(self, mp3s: List[Mp3]):
         pass
 
     def on_mp3s_images_loaded(self):
         debug("Reloading mp3s model")
         # self.ui.localSongs.invalidate()
         self.reload_local_songs_artists_albums()
+        # (covers of the same rows)
+        self.ui.localSongs.viewport().update()
+        self.ui.localArtists.viewport().update()
+        self.ui.localAlbums.viewport().update()
+
+    def on_mp3s_scanned(self, delta: localsongs.ScanDelta):
+        debug(f"Local songs scanned: {delta}")
+        self.remove_local_songs_artists_albums(delta.removed + delta.replaced)
+        self.update_local_song_count()
 
-    def on_action_refresh(self):
-        localsongs.clear_mp3s()
-
-        self.reload_local_songs_artists_albums()
-
+    def on_local_songs_changed(self, delta: localsongs.ScanDelta):
+        debug(f"Local songs changed: {delta}")
+        self.remove_local_songs_artists_albums(delta.removed + delta.replaced)
+        self.add_local_songs_artists_albums(delta.added + delta.changed)
         self.update_local_song_count()
+        repository.update_localsongs_cache_background()
+
+    def on_action_refresh(self):
+        # rescan: only added/changed/removed files are loaded again
+        self.local_songs_watcher.stop()
         repository.load_mp3s(preferences.directory(),
-                                        mp3_loaded_callback=self.on_mp3_loaded,
-                                        mp3_image_loaded_callback=self.on_mp3_image_loaded,
+                                        mp3s_batch_loaded_callback=self.on_mp3s_batch_loaded,
+                                        mp3s_batch_images_loaded_callback=self.on_mp3s_batch_images_loaded,
                                         mp3s_loaded_callback=self.on_mp3s_loaded,
-                                        mp3s_images_loaded_callback=self.on_mp3s_images_loaded)
+                                        mp3s_images_loaded_callback=self.on_mp3s_images_loaded,
+                                        mp3s_scanned_callback=self.on_mp3s_scanned,
+                                        mp3s_loaded_from_cache_callback=self.on_mp3s_loaded_from_cache,
+                                        mp3s_scan_progress_callback=self.on_mp3s_scan_progress)
 
     def on_action_reload(self):
-        cache.clear_localsongs()
-        self.on_action_refresh()
+        # forget everything and read all the files again
+        self.local_songs_watcher.stop()
+        localsongs.clear_mp3s()
 
-    def reload_local_songs_artists_albums(self):
-        self.local_songs_model.beginResetModel()
-        self.local_songs_model.reload()
-        self.local_songs_model.endResetModel()
+        self.reload_local_songs_artists_albums()
 
-        self.local_artists_model.beginResetModel()
-        self.local_artists_model.reload()
-        self.local_artists_model.endResetModel()
+        self.update_local_song_count()
+        # (scanned once the snapshot is cleared, otherwise it would be read again)
+        repository.clear_localsongs_cache_background(self.on_action_refresh)
 
-        self.local_albums_model.beginResetModel()
-        self.local_albums_model.reload()
-        self.local_albums_model.endResetModel()
+    def reload_local_songs_artists_albums(self):
+        # only the rows that changed are notified to the views
+        self.local_songs_model.update()
+        self.local_artists_model.update()
+        self.local_albums_model.update()
+
+    def add_local_songs_artists_albums(self, mp3s: List[Mp3]):
+        # just the rows of the given mp3s (added or changed) are updated
+        self.local_songs_model.add(mp3s)
+        self.local_artists_model.refresh(mp3s)
+        self.local_albums_model.refresh(mp3s)
+
+    def remove_local_songs_artists_albums(self, mp3s: List[Mp3]):
+        # just the rows of the given mp3s (removed or replaced) are updated
+        self.local_songs_model.remove(mp3s)
+        self.local_artists_model.refresh(mp3s)
+        self.local_albums_model.refresh(mp3s)
 
     def update_local_song_count(self):
         self.ui.localSongCount.setText(f"{len(localsongs.mp3s)} songs")
@@ -1791,7 +1841,7 @@ class MainWindow(QMainWindow):
     def on_local_songs_filter_changed(self):
         filter_text = self.ui.localSongsFilter.text()
         debug(f"on_local_songs_filter_changed({filter_text})")
-        self.local_songs_proxy_model.setFilterRegularExpression(QRegularExpression(filter_text, QRegularExpression.PatternOption.CaseInsensitiveOption))
+        self.local_songs_proxy_model.set_filter_text(filter_text)
 
 
     def on_local_artists_filter_changed(self):
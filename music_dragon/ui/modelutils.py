@@ -0,0 +1,101 @@
+from typing import Callable, List, Any, Optional
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex
+
+
+def update_rows(model: QAbstractListModel, rows: List, new_rows: List, key: Callable[[Any], Any]):
+    # Turns rows into new_rows (both sorted by key, which identifies
+    # an entry as well) notifying only the rows actually inserted, removed
+    # or changed, instead of resetting the whole model
+    keys = [key(row) for row in rows]
+    new_keys = [key(row) for row in new_rows]
+
+    i = j = 0
+    while i < len(rows) or j < len(new_rows):
+        if j >= len(new_rows) or (i < len(rows) and keys[i] < new_keys[j]):
+            # removed
+            end = i + 1
+            while end < len(rows) and (j >= len(new_rows) or keys[end] < new_keys[j]):
+                end += 1
+            model.beginRemoveRows(QModelIndex(), i, end - 1)
+            del rows[i:end]
+            del keys[i:end]
+            model.endRemoveRows()
+        elif i >= len(rows) or new_keys[j] < keys[i]:
+            # inserted
+            end = j + 1
+            while end < len(new_rows) and (i >= len(rows) or new_keys[end] < keys[i]):
+                end += 1
+            model.beginInsertRows(QModelIndex(), i, i + end - j - 1)
+            rows[i:i] = new_rows[j:end]
+            keys[i:i] = new_keys[j:end]
+            model.endInsertRows()
+            i += end - j
+            j = end
+        else:
+            # same entry: changed if it's another object now
+            start = i
+            while i < len(rows) and j < len(new_rows) and keys[i] == new_keys[j] and rows[i] is not new_rows[j]:
+                rows[i] = new_rows[j]
+                i += 1
+                j += 1
+            if start < i:
+                model.dataChanged.emit(model.index(start), model.index(i - 1))
+            else:
+                i += 1
+                j += 1
+
+
+def _bisect(rows: List, k, key: Callable[[Any], Any]) -> int:
+    # The first position of rows (sorted by key) whose key is not less than k
+    lo, hi = 0, len(rows)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key(rows[mid]) < k:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def insert_rows(model: QAbstractListModel, rows: List, new_rows: List, key: Callable[[Any], Any]):
+    # Puts new_rows in rows (sorted by key) at their place: the rows with
+    # the same key are replaced, and the new rows that end up next
+    # to each other are inserted at once
+    new_rows = sorted(new_rows, key=key)
+    j = 0
+    while j < len(new_rows):
+        k = key(new_rows[j])
+        i = _bisect(rows, k, key)
+        if i < len(rows) and key(rows[i]) == k:
+            if rows[i] is not new_rows[j]:
+                rows[i] = new_rows[j]
+                model.dataChanged.emit(model.index(i), model.index(i))
+            j += 1
+            continue
+        end = j + 1
+        while end < len(new_rows) and (i >= len(rows) or key(new_rows[end]) < key(rows[i])) and \
+                key(new_rows[end]) != key(new_rows[end - 1]):
+            end += 1
+        model.beginInsertRows(QModelIndex(), i, i + end - j - 1)
+        rows[i:i] = new_rows[j:end]
+        model.endInsertRows()
+        j = end
+
+
+def find_row(rows: List, k, key: Callable[[Any], Any]) -> Optional[int]:
+    # The position of the row with key k in rows (sorted by key), if any
+    i = _bisect(rows, k, key)
+    if i < len(rows) and key(rows[i]) == k:
+        return i
+    return None
+
+
+def remove_rows(model: QAbstractListModel, rows: List, old_rows: List, key: Callable[[Any], Any]):
+    # Removes old_rows from rows (sorted by key), if they are still there
+    for row in old_rows:
+        i = find_row(rows, key(row), key)
+        if i is not None and rows[i] is row:
+            model.beginRemoveRows(QModelIndex(), i, i)
+            del rows[i]
+            model.endRemoveRows()
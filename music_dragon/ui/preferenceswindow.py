@@ -2,7 +2,7 @@ from pathlib import Path
 
 from PyQt6.QtWidgets import QDialog, QFileDialog, QMessageBox
 
-from music_dragon import cache, preferences, ytdownloader
+from music_dragon import cache, preferences, repository, ytdownloader
 from music_dragon.log import debug
 from music_dragon.ui.ui_preferenceswindow import Ui_PreferencesWindow
 from music_dragon.utils import open_folder, app_cache_path
@@ -61,9 +61,13 @@ class PreferencesWindow(QDialog):
         self.ui.manualOutputFormat.setText(preferences.manual_output_format())
         self.ui.threadNumber.setValue(preferences.thread_number())
         self.ui.maxSimultaneousDownloads.setValue(preferences.max_simultaneous_downloads())
+        self.ui.localSongsScanProcesses.setValue(preferences.localsongs_scan_processes())
         self.ui.cacheImagesCheck.setChecked(preferences.is_images_cache_enabled())
         self.ui.cacheRequestsBox.setChecked(preferences.is_requests_cache_enabled())
         self.ui.cacheLocalSongs.setChecked(preferences.is_localsongs_cache_enabled())
+        self.ui.cacheImagesMaxSize.setValue(preferences.images_cache_max_size())
+        self.ui.cacheRequestsMaxSize.setValue(preferences.requests_cache_max_size())
+        self.ui.cacheLocalSongsMaxSize.setValue(preferences.localsongs_cache_max_size())
         self.ui.cache.setText(str(app_cache_path().absolute()))
         self.ui.youtubeCookiesFromBrowserCombo.setCurrentIndex(
             PreferencesWindow.YT_COOKIES_FROM_BROWSER.index(preferences.get_youtube_cookies_from_browser()))
@@ -80,14 +84,21 @@ class PreferencesWindow(QDialog):
         preferences.set_manual_output_format(self.ui.manualOutputFormat.text())
         preferences.set_thread_number(self.ui.threadNumber.value())
         preferences.set_max_simultaneous_downloads(self.ui.maxSimultaneousDownloads.value())
+        preferences.set_localsongs_scan_processes(self.ui.localSongsScanProcesses.value())
 
         preferences.set_images_cache_enabled(self.ui.cacheImagesCheck.isChecked())
         preferences.set_requests_cache_enabled(self.ui.cacheRequestsBox.isChecked())
         preferences.set_localsongs_cache_enabled(self.ui.cacheLocalSongs.isChecked())
+        preferences.set_images_cache_max_size(self.ui.cacheImagesMaxSize.value())
+        preferences.set_requests_cache_max_size(self.ui.cacheRequestsMaxSize.value())
+        preferences.set_localsongs_cache_max_size(self.ui.cacheLocalSongsMaxSize.value())
 
         cache.enable_images_cache(preferences.is_images_cache_enabled())
         cache.enable_requests_cache(preferences.is_requests_cache_enabled())
         cache.enable_localsongs_cache(preferences.is_localsongs_cache_enabled())
+        cache.set_images_cache_limit(preferences.images_cache_max_size() * 2 ** 20)
+        cache.set_requests_cache_limit(preferences.requests_cache_max_size() * 2 ** 20)
+        cache.set_localsongs_cache_limit(preferences.localsongs_cache_max_size() * 2 ** 20)
 
         preferences.set_youtube_cookies_from_browser(
             PreferencesWindow.YT_COOKIES_FROM_BROWSER[self.ui.youtubeCookiesFromBrowserCombo.currentIndex()])
@@ -193,8 +204,13 @@ class PreferencesWindow(QDialog):
         open_folder(app_cache_path())
 
     def on_clear_cache_button_clicked(self):
-        cache.clear()
-        self.update_cache_size()
+        repository.clear_cache_background(self.update_cache_size)
 
     def update_cache_size(self):
         self.ui.cacheSize.setText(f"Size: {int(cache.cache_size() / 2 ** 20)}MB")
+        stats = cache.stats()
+        self.ui.cacheSize.setToolTip("\n".join([
+            f"Images: {int(stats[cache.NAMESPACE_IMAGE]['size'] / 2 ** 20)}MB",
+            f"Requests: {int(stats[cache.NAMESPACE_REQUEST]['size'] / 2 ** 20)}MB",
+            f"Local songs: {int(stats[cache.NAMESPACE_LOCALSONGS]['size'] / 2 ** 20)}MB",
+        ]))
@@ -0,0 +1,146 @@
+from typing import Optional, Dict, Set, Callable
+
+from PyQt6.QtCore import Qt, QBuffer, QIODevice, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap, QPixmapCache
+
+from music_dragon import cache, workers
+from music_dragon.localsongs import Mp3
+from music_dragon.log import debug
+from music_dragon.workers import Worker
+
+# ============ THUMBNAILS ============
+# Pre-scaled covers of the local songs, painted by the list views
+# instead of decoding the full size cover on every paint.
+# Thumbnails are generated once per cover (by fingerprint) in background,
+# persisted among the cached images and kept as pixmaps in QPixmapCache
+# ====================================
+
+THUMBNAIL_SIZE_SMALL = 48
+THUMBNAIL_SIZE_LARGE = 128 # e.g. for high dpi screens
+THUMBNAIL_SIZES = [THUMBNAIL_SIZE_SMALL, THUMBNAIL_SIZE_LARGE]
+THUMBNAIL_FORMAT = "PNG"
+
+PIXMAP_CACHE_LIMIT = 32 * 1024 # KB
+
+# fingerprint -> callbacks to call once its thumbnails are ready
+_pending: Dict[str, Set[Callable]] = {}
+# fingerprints of the covers that have been read but can't be decoded
+_invalid: Set[str] = set()
+
+
+def thumbnail_size(size: int, device_pixel_ratio: float = 1) -> int:
+    # The smallest thumbnail size that fits the given size, in device pixels
+    size = size * device_pixel_ratio
+    return next((s for s in THUMBNAIL_SIZES if s >= size), THUMBNAIL_SIZES[-1])
+
+
+def _pixmap_key(fingerprint: str, size: int):
+    return f"thumbnail-{size}-{fingerprint}"
+
+
+def get_thumbnail(mp3: Optional[Mp3], size: int, thumbnail_ready_callback=None) -> Optional[QPixmap]:
+    # Returns the thumbnail of the cover of the mp3 if it's ready;
+    # otherwise it's loaded (or generated) in background and
+    # the callback is called once it's ready
+    if not mp3 or not mp3.has_image():
+        return None
+    fingerprint = mp3.image_fingerprint
+    pixmap = QPixmapCache.find(_pixmap_key(fingerprint, size))
+    if pixmap is not None:
+        return pixmap
+    if fingerprint in _invalid:
+        return None
+
+    callbacks = _pending.get(fingerprint)
+    if callbacks is None:
+        _pending[fingerprint] = callbacks = set()
+        _load_thumbnails_background(mp3)
+    if callable(thumbnail_ready_callback):
+        callbacks.add(thumbnail_ready_callback)
+    return None
+
+
+def _on_thumbnails_loaded(fingerprint: str, images: dict, invalid: bool):
+    if QPixmapCache.cacheLimit() < PIXMAP_CACHE_LIMIT:
+        QPixmapCache.setCacheLimit(PIXMAP_CACHE_LIMIT)
+
+    if not images and not invalid:
+        # the cover couldn't be read (e.g. the file is being written):
+        # retried the next time it's requested
+        _pending.pop(fingerprint, None)
+        return
+
+    if images:
+        for size, image in images.items():
+            QPixmapCache.insert(_pixmap_key(fingerprint, size), QPixmap.fromImage(image))
+    else:
+        _invalid.add(fingerprint)
+
+    for callback in _pending.pop(fingerprint, set()):
+        callback()
+
+
+def _on_thumbnails_not_loaded(fingerprint: str):
+    # (canceled or failed: retried the next time it's requested)
+    _pending.pop(fingerprint, None)
+
+
+# ============ LOAD THUMBNAILS ============
+# Load the thumbnails of a cover from the cache,
+# or generate them from the cover
+# =========================================
+
+class LoadThumbnailsWorker(Worker):
+    thumbnails_loaded = pyqtSignal(str, dict, bool) # fingerprint, images, whether the cover is invalid
+
+    def __init__(self, mp3: Mp3):
+        super().__init__()
+        self.mp3 = mp3
+        self.fingerprint = mp3.image_fingerprint
+
+    def run(self):
+        # (QImage, unlike QPixmap, can be used outside the GUI thread)
+        images = {}
+        for size in THUMBNAIL_SIZES:
+            data = cache.get_thumbnail(self.fingerprint, size)
+            image = QImage.fromData(data) if data else None
+            if image is None or image.isNull():
+                break
+            images[size] = image
+        else:
+            self.thumbnails_loaded.emit(self.fingerprint, images, False)
+            return
+
+        images = {}
+        data = self.mp3.image
+        if not data:
+            print(f"WARN: failed to read cover of {self.mp3}")
+            self.thumbnails_loaded.emit(self.fingerprint, images, False)
+            return
+
+        cover = QImage.fromData(data)
+        if not cover.isNull():
+            debug(f"Generating thumbnails of {self.mp3}")
+            for size in THUMBNAIL_SIZES:
+                image = cover.scaled(size, size,
+                                     Qt.AspectRatioMode.KeepAspectRatio,
+                                     Qt.TransformationMode.SmoothTransformation)
+                images[size] = image
+
+                buffer = QBuffer()
+                buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+                image.save(buffer, THUMBNAIL_FORMAT)
+                cache.put_thumbnail(self.fingerprint, size, bytes(buffer.data()))
+        else:
+            print(f"WARN: failed to decode cover of {self.mp3}")
+
+        self.thumbnails_loaded.emit(self.fingerprint, images, cover.isNull())
+
+
+def _load_thumbnails_background(mp3: Mp3, priority=Worker.PRIORITY_NORMAL):
+    worker = LoadThumbnailsWorker(mp3)
+    worker.priority = priority
+    worker.thumbnails_loaded.connect(_on_thumbnails_loaded)
+    worker.canceled.connect(lambda fingerprint=worker.fingerprint: _on_thumbnails_not_loaded(fingerprint))
+    worker.failed.connect(lambda fingerprint=worker.fingerprint: _on_thumbnails_not_loaded(fingerprint))
+    workers.schedule(worker)
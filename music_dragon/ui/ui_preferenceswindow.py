@@ -214,6 +214,33 @@ class Ui_PreferencesWindow(object):
         self.cacheLocalSongs = QtWidgets.QCheckBox(parent=self.cacheWidget)
         self.cacheLocalSongs.setObjectName("cacheLocalSongs")
         self.verticalLayout_13.addWidget(self.cacheLocalSongs)
+        self.formLayout = QtWidgets.QFormLayout()
+        self.formLayout.setObjectName("formLayout")
+        self.label_20 = QtWidgets.QLabel(parent=self.cacheWidget)
+        self.label_20.setObjectName("label_20")
+        self.formLayout.setWidget(0, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_20)
+        self.cacheImagesMaxSize = QtWidgets.QSpinBox(parent=self.cacheWidget)
+        self.cacheImagesMaxSize.setMaximum(1000000)
+        self.cacheImagesMaxSize.setSingleStep(64)
+        self.cacheImagesMaxSize.setObjectName("cacheImagesMaxSize")
+        self.formLayout.setWidget(0, QtWidgets.QFormLayout.ItemRole.FieldRole, self.cacheImagesMaxSize)
+        self.label_21 = QtWidgets.QLabel(parent=self.cacheWidget)
+        self.label_21.setObjectName("label_21")
+        self.formLayout.setWidget(1, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_21)
+        self.cacheRequestsMaxSize = QtWidgets.QSpinBox(parent=self.cacheWidget)
+        self.cacheRequestsMaxSize.setMaximum(1000000)
+        self.cacheRequestsMaxSize.setSingleStep(64)
+        self.cacheRequestsMaxSize.setObjectName("cacheRequestsMaxSize")
+        self.formLayout.setWidget(1, QtWidgets.QFormLayout.ItemRole.FieldRole, self.cacheRequestsMaxSize)
+        self.label_22 = QtWidgets.QLabel(parent=self.cacheWidget)
+        self.label_22.setObjectName("label_22")
+        self.formLayout.setWidget(2, QtWidgets.QFormLayout.ItemRole.LabelRole, self.label_22)
+        self.cacheLocalSongsMaxSize = QtWidgets.QSpinBox(parent=self.cacheWidget)
+        self.cacheLocalSongsMaxSize.setMaximum(1000000)
+        self.cacheLocalSongsMaxSize.setSingleStep(64)
+        self.cacheLocalSongsMaxSize.setObjectName("cacheLocalSongsMaxSize")
+        self.formLayout.setWidget(2, QtWidgets.QFormLayout.ItemRole.FieldRole, self.cacheLocalSongsMaxSize)
+        self.verticalLayout_13.addLayout(self.formLayout)
         self.cacheSize = QtWidgets.QLabel(parent=self.cacheWidget)
         self.cacheSize.setAlignment(QtCore.Qt.AlignmentFlag.AlignRight|QtCore.Qt.AlignmentFlag.AlignTrailing|QtCore.Qt.AlignmentFlag.AlignVCenter)
         self.cacheSize.setObjectName("cacheSize")
@@ -288,6 +315,30 @@ class Ui_PreferencesWindow(object):
         self.label_7.setObjectName("label_7")
         self.verticalLayout_10.addWidget(self.label_7)
         self.verticalLayout_7.addWidget(self.widget_4)
+        self.widget_9 = QtWidgets.QWidget(parent=self.scrollAreaWidgetContents_2)
+        self.widget_9.setObjectName("widget_9")
+        self.verticalLayout_25 = QtWidgets.QVBoxLayout(self.widget_9)
+        self.verticalLayout_25.setObjectName("verticalLayout_25")
+        self.label_23 = QtWidgets.QLabel(parent=self.widget_9)
+        font = QtGui.QFont()
+        font.setPointSize(14)
+        font.setBold(True)
+        self.label_23.setFont(font)
+        self.label_23.setObjectName("label_23")
+        self.verticalLayout_25.addWidget(self.label_23)
+        self.localSongsScanProcesses = QtWidgets.QSpinBox(parent=self.widget_9)
+        self.localSongsScanProcesses.setMinimum(1)
+        self.localSongsScanProcesses.setMaximum(64)
+        self.localSongsScanProcesses.setObjectName("localSongsScanProcesses")
+        self.verticalLayout_25.addWidget(self.localSongsScanProcesses)
+        self.label_24 = QtWidgets.QLabel(parent=self.widget_9)
+        font = QtGui.QFont()
+        font.setPointSize(10)
+        font.setItalic(True)
+        self.label_24.setFont(font)
+        self.label_24.setObjectName("label_24")
+        self.verticalLayout_25.addWidget(self.label_24)
+        self.verticalLayout_7.addWidget(self.widget_9)
         spacerItem2 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Policy.Minimum, QtWidgets.QSizePolicy.Policy.Expanding)
         self.verticalLayout_7.addItem(spacerItem2)
         self.scrollArea_2.setWidget(self.scrollAreaWidgetContents_2)
@@ -494,6 +545,15 @@ class Ui_PreferencesWindow(object):
         self.cacheImagesCheck.setText(_translate("PreferencesWindow", "Cache images"))
         self.cacheRequestsBox.setText(_translate("PreferencesWindow", "Cache requests"))
         self.cacheLocalSongs.setText(_translate("PreferencesWindow", "Cache local songs"))
+        self.label_20.setText(_translate("PreferencesWindow", "Images max size"))
+        self.cacheImagesMaxSize.setSpecialValueText(_translate("PreferencesWindow", "Unlimited"))
+        self.cacheImagesMaxSize.setSuffix(_translate("PreferencesWindow", " MB"))
+        self.label_21.setText(_translate("PreferencesWindow", "Requests max size"))
+        self.cacheRequestsMaxSize.setSpecialValueText(_translate("PreferencesWindow", "Unlimited"))
+        self.cacheRequestsMaxSize.setSuffix(_translate("PreferencesWindow", " MB"))
+        self.label_22.setText(_translate("PreferencesWindow", "Local songs max size"))
+        self.cacheLocalSongsMaxSize.setSpecialValueText(_translate("PreferencesWindow", "Unlimited"))
+        self.cacheLocalSongsMaxSize.setSuffix(_translate("PreferencesWindow", " MB"))
         self.cacheSize.setText(_translate("PreferencesWindow", "Size: 0MB"))
         self.cacheClearButton.setText(_translate("PreferencesWindow", "Clear Cache"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_3), _translate("PreferencesWindow", "Cache"))
@@ -501,6 +561,8 @@ class Ui_PreferencesWindow(object):
         self.label_5.setText(_translate("PreferencesWindow", "This option requires an application restart to take effect."))
         self.label_8.setText(_translate("PreferencesWindow", "Maximum simultaneous downloads"))
         self.label_7.setText(_translate("PreferencesWindow", "This option requires an application restart to take effect."))
+        self.label_23.setText(_translate("PreferencesWindow", "Local songs scan processes"))
+        self.label_24.setText(_translate("PreferencesWindow", "Number of processes reading the tags of the local songs in parallel."))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_2), _translate("PreferencesWindow", "Threads"))
         self.label_10.setText(_translate("PreferencesWindow", "Cookies from browser"))
         self.youtubeCookiesFromBrowserCombo.setItemText(0, _translate("PreferencesWindow", "Disabled"))
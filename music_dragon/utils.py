@@ -138,8 +138,8 @@ def is_win():
     return sys.platform.startswith("win")
 
 
-def crc32(data: bytes):
-    return zlib.crc32(data)
+def crc32(data: bytes, value: int = 0):
+    return zlib.crc32(data, value)
 
 class Mergeable:
     def merge(self, other):
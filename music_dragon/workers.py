@@ -41,6 +41,7 @@ class Worker(QObject):
     started = pyqtSignal() # emitted when started
     canceled = pyqtSignal() # emitted when (actually) canceled; could eventually be emitted before started
     finished = pyqtSignal() # emitted when completed (not canceled)
+    failed = pyqtSignal() # emitted when run() raised
 
     next_id = 0
 
@@ -59,7 +60,12 @@ class Worker(QObject):
     def exec(self):
         self.status = Worker.STATUS_RUNNING
         self.started.emit()
-        self.run()
+        try:
+            self.run()
+        except Exception:
+            self.status = Worker.STATUS_FINISHED
+            self.failed.emit()
+            raise
         self.status = Worker.STATUS_FINISHED
         if self.is_canceled:
             self.canceled.emit()
@@ -117,6 +123,7 @@ class Thread(QThread):
         w.moveToThread(self)
         w.started.connect(self._on_worker_started)
         w.canceled.connect(self._on_worker_canceled)
+        w.failed.connect(self._on_worker_canceled) # (not going to complete either)
         w.finished.connect(self._on_worker_finished)
         QMetaObject.invokeMethod(w, "exec", Qt.ConnectionType.QueuedConnection)
 
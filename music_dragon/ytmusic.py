@@ -810,6 +810,8 @@ def search_youtube_album(artist_name: str, album_title: str, callback, priority=
         worker.priority = priority
         worker.result.connect(callback)
         workers.schedule(worker)
+        return worker
+    return None
 
 # ========== FETCH YOUTUBE TRACK ===========
 # Fetch youtube track